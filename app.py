@@ -1,31 +1,205 @@
-from quart import Quart, jsonify, request
+from quart import Quart, Response, g, jsonify, request
 from quart_cors import cors
 import os
-import pandas as pd
 from apscheduler.schedulers.background import BackgroundScheduler
 import asyncio
-from services.marks_predictions import predict_marks
-from db.marks_data_fetch import fetch_student_data
-from services.attendance_predictions import predict_attendance
-from db.attendance_data_fetch import process_all_students
-from db.attendance_timetable_fetch import fetch_latest_timetable
-from scripts.retrain_attendance_model import train_and_save_model
+import json
+import logging
+import subprocess
+import sys
+import threading
+import time
+from services.marks_predictions import get_marks_bundle, marks_bundle_loaded, predict_marks, predict_marks_batch, reload_marks_bundle
+from db.marks_data_fetch import fetch_student_data, fetch_students_data
+from services.attendance_predictions import predict_attendance, predict_attendance_batch
+from services.model_registry import model_registry
+from services.prediction_cache import prediction_cache
+from db.attendance_timetable_fetch import fetch_latest_timetable, get_timetable_cache_stats
+from scripts.run_pipeline import PIPELINE_N_JOBS, PipelineLock, lock_holder, pipeline_running, read_state
+from db.connection import dispose_db_engine, get_pool_stats
+from db.prediction_store import get_prediction_store_stats, get_stored_prediction
+from db.utils.flask_security import close_decrypt_client, decrypted_value_cache
+from services import metrics
 
 app = Quart(__name__)
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "").split(",")
 allowed_origins = [origin.strip() for origin in allowed_origins if origin.strip()]
 app = cors(app, allow_origin=allowed_origins)
 
-DATA_FILE = os.path.join("data", "attendance", "processed", "processed_attendance_dataset.csv")
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
 
-if os.path.exists(DATA_FILE):
-    data = pd.read_csv(DATA_FILE, na_values=['NaN', '?', ''])
-else:
-    data = pd.DataFrame()  
+# Attendance model and processed dataset, swapped in place after retraining.
+# Nothing is loaded at import: the warm-up task (or the first request that
+# needs a model) loads each family once.
+MODEL_RELOAD_MINUTES = int(os.getenv("MODEL_RELOAD_MINUTES", "5"))
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "1") == "1"
+
+logger = logging.getLogger(__name__)
+_warmup_lock = threading.Lock()
+_warmup_thread = None
+_warmup = {"started_at": None, "seconds": None, "error": None}
+
+def warm_up_models():
+    start = time.perf_counter()
+    try:
+        model_registry.current()
+        get_marks_bundle()
+    except Exception as e:
+        logger.error(f"Model warm-up failed: {e}")
+        _warmup["error"] = str(e)
+    _warmup["seconds"] = round(time.perf_counter() - start, 3)
+
+def start_warmup():
+    # Loads the models in a background thread; returns immediately
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is not None and _warmup_thread.is_alive():
+            return
+        _warmup.update(started_at=time.time(), seconds=None, error=None)
+        _warmup_thread = threading.Thread(target=warm_up_models, name="model-warmup", daemon=True)
+        _warmup_thread.start()
+
+def model_states():
+    loading = _warmup_thread is not None and _warmup_thread.is_alive()
+    def state(loaded):
+        return "warm" if loaded else "loading" if loading else "cold"
+    return {"attendance": state(model_registry.loaded()), "marks": state(marks_bundle_loaded())}
+
+def wants_fresh():
+    # ?fresh=true skips the precomputed predictions and computes live
+    return request.args.get("fresh", "").lower() in ("1", "true", "yes")
+
+# The first load runs in a worker thread (where it may also wait for the
+# warm-up thread's load), so the event loop keeps serving other requests
+async def current_artifacts():
+    if model_registry.loaded():
+        artifacts = model_registry.current()
+    else:
+        artifacts = await asyncio.to_thread(model_registry.current)
+    g.model_version = artifacts.version
+    return artifacts
+
+async def current_marks_bundle():
+    if marks_bundle_loaded():
+        return get_marks_bundle()
+    return await asyncio.to_thread(get_marks_bundle)
+
+def error_response(e):
+    # Handlers still answer with the error string; the failure is also
+    # logged and counted by exception type
+    logger.exception(f"{request.endpoint} failed")
+    metrics.count("request_errors_total", endpoint=request.endpoint, error=type(e).__name__)
+    return jsonify({"error": str(e)}), 500
+
+@app.before_request
+async def start_request_metrics():
+    g.metrics_token = metrics.begin_scope(request.endpoint or "unknown")
+
+@app.after_request
+async def add_model_version(response):
+    # The version that actually served the request, not the newest one
+    version = getattr(g, "model_version", None)
+    if version:
+        response.headers["X-Model-Version"] = version
+    return response
+
+@app.after_request
+async def record_request_metrics(response):
+    scope = metrics.end_scope(getattr(g, "metrics_token", None))
+    if scope is not None:
+        metrics.observe("http_request_duration_seconds", scope.elapsed(),
+                        endpoint=scope.name, method=request.method, status=response.status_code)
+        if metrics.SERVER_TIMING_HEADER:
+            response.headers["Server-Timing"] = scope.server_timing()
+    return response
 
 @app.route('/wakeup', methods=['GET'])
 def wakeup():
-    return jsonify({"status": "ok"})
+    # Reports whether the models are loaded and starts loading them if not
+    models = model_states()
+    if "cold" in models.values():
+        start_warmup()
+        models = model_states()
+    return jsonify({
+        "status": "ok",
+        "warm": all(state == "warm" for state in models.values()),
+        "models": models,
+        "warmup_seconds": _warmup["seconds"],
+        "warmup_error": _warmup["error"],
+    })
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        "db_pool": get_pool_stats(),
+        "decrypt_cache": decrypted_value_cache.stats(),
+        "timetable_cache": get_timetable_cache_stats(),
+        "model": model_registry.stats(),
+        "prediction_cache": prediction_cache.stats(),
+        "prediction_store": get_prediction_store_stats()
+    })
+
+def collect_service_stats():
+    # The counters the caches, stores and pipeline already keep, for /metrics
+    cache = prediction_cache.stats()
+    store = get_prediction_store_stats()
+    decrypt_cache = decrypted_value_cache.stats()
+    timetable_cache = get_timetable_cache_stats()
+    pool = get_pool_stats()
+    model = model_registry.stats()
+    pipeline = read_state()
+    training = pipeline.get("training") or {}
+    return [
+        ("prediction_cache_lookups_total", "counter", "Prediction cache lookups by result",
+         [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"]),
+          ({"result": "coalesced"}, cache["coalesced"])]),
+        ("prediction_cache_bytes", "gauge", "Size of the cached prediction responses", [({}, cache["bytes"])]),
+        ("prediction_cache_evictions_total", "counter", "Prediction cache evictions", [({}, cache["evictions"])]),
+        ("prediction_store_lookups_total", "counter", "Precomputed prediction lookups by result",
+         [({"result": "hit"}, store["hits"]), ({"result": "miss"}, store["misses"]),
+          ({"result": "stale"}, store["stale"])]),
+        ("decrypt_cache_lookups_total", "counter", "Decrypted value cache lookups by result",
+         [({"result": "hit"}, decrypt_cache["hits"]), ({"result": "miss"}, decrypt_cache["misses"])]),
+        ("timetable_cache_lookups_total", "counter", "Timetable cache lookups by result",
+         [({"result": "hit"}, timetable_cache["hits"]), ({"result": "miss"}, timetable_cache["misses"])]),
+        ("db_pool_checkouts_total", "counter", "Connections taken from the DB pool", [({}, pool["checkouts"])]),
+        ("db_pool_wait_seconds_total", "counter", "Time spent waiting for a DB connection",
+         [({}, pool["wait_time_total_seconds"])]),
+        ("db_pool_checked_out", "gauge", "DB connections in use", [({}, pool.get("checked_out"))]),
+        ("model_reloads_total", "counter", "Attendance model reloads by outcome",
+         [({"result": "succeeded"}, model["reloads"]), ({"result": "failed"}, model["failed_reloads"])]),
+        ("model_unknown_labels_total", "counter", "Timetable labels the encoders have not seen",
+         [({"column": col}, encoder["unknown"]) for col, encoder in model["encoders"].items()]),
+        # The pipeline runs in its own process; its last run comes from the state file
+        ("pipeline_running", "gauge", "Whether the attendance pipeline is running",
+         [({}, pipeline.get("status") == "running")]),
+        ("pipeline_last_run_seconds", "gauge", "Duration of the last pipeline run",
+         [({"status": pipeline.get("status")}, pipeline.get("duration_seconds"))]),
+        ("pipeline_stage_seconds", "gauge", "Stage times of the last pipeline run",
+         [({"stage": stage.removesuffix("_seconds")}, seconds) for stage, seconds in pipeline.get("stages", {}).items()]
+         + [({"stage": stage}, seconds) for stage, seconds in (pipeline.get("breakdown") or {}).items()]),
+        ("training_stage_seconds", "gauge", "Stage times of the last attendance model training",
+         [({"stage": stage}, seconds) for stage, seconds in training.get("stages", {}).items()]),
+    ]
+
+metrics.registry.add_collector(collect_service_stats)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Prometheus text exposition format
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+@app.before_serving
+async def startup():
+    scheduler.start()
+    if WARMUP_ON_START:
+        start_warmup()
+
+@app.after_serving
+async def shutdown():
+    scheduler.shutdown(wait=False)
+    await close_decrypt_client()
+    dispose_db_engine()
 
 @app.route('/predict-marks', methods=['POST'])
 async def predict_marks_api():
@@ -36,18 +210,58 @@ async def predict_marks_api():
         if not prn:
             return jsonify({"error": "No PRN provided"}), 400
 
-        student_data = await fetch_student_data(prn)
+        bundle_version = (await current_marks_bundle()).version
+        if not wants_fresh():
+            stored = get_stored_prediction("marks", prn, {"bundle_version": bundle_version})
+            if stored is not None:
+                return jsonify(stored)
+
+        async def compute():
+            student_data = await fetch_student_data(prn)
+
+            if student_data.empty:
+                return {"error": "Student data not found"}, 404
+
+            input_data = student_data.to_dict(orient="records")[0]
+            return predict_marks(input_data), 200
+
+        key = ("marks", json.dumps(prn), bundle_version, prediction_cache.data_version("marks"))
+        predictions, status = await prediction_cache.get_or_compute(key, compute)
+
+        return jsonify(predictions), status
+
+    except Exception as e:
+        return error_response(e)
+
+
+@app.route('/predict-marks/batch', methods=['POST'])
+async def predict_marks_batch_api():
+    try:
+        input_data = await request.get_json()
+        prns = input_data.get("prns")
+
+        if not prns or not isinstance(prns, list):
+            return jsonify({"error": "A list of PRNs is required"}), 400
+
+        if len(prns) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"At most {MAX_BATCH_SIZE} PRNs can be predicted per request"}), 400
+
+        student_data = await fetch_students_data(prns)
 
-        if student_data.empty:
-            return jsonify({"error": "Student data not found"}), 404
+        predictions = {}
+        if not student_data.empty:
+            # Loaded here so a cold load doesn't block the event loop
+            await current_marks_bundle()
+            for prn, result in zip(student_data['prn'], predict_marks_batch(student_data)):
+                predictions[str(prn)] = result
 
-        input_data = student_data.to_dict(orient="records")[0]
-        predictions = predict_marks(input_data)
+        for prn in prns:
+            predictions.setdefault(str(prn), {"error": "Student data not found"})
 
         return jsonify(predictions)
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
 
 
 @app.route('/predict-attendance', methods=['POST'])
@@ -64,28 +278,144 @@ async def predict_attendance_api():
         if not week_data:
             return jsonify({"error": "No timetable data found for this PRN"}), 404
 
-        predictions = predict_attendance(week_data, data)
+        artifacts = await current_artifacts()
+        week_number = week_data['week_number'][0]
 
-        if isinstance(predictions, dict):
-            return jsonify(predictions), 200
-        
-        predictions_json = predictions.to_dict(orient='records')
-        return jsonify(predictions_json), 200
+        if not wants_fresh():
+            # Precomputed by the nightly/post-retrain scoring run
+            # (stale once ingestion has changed the attendance summary)
+            stored = get_stored_prediction("attendance", prn, {
+                "model_version": artifacts.version,
+                "week_number": week_number,
+                "data_version": artifacts.summary.version,
+            })
+            if stored is not None:
+                return jsonify(stored), 200
+
+        async def compute():
+            predictions = predict_attendance(week_data, artifacts)
+
+            if isinstance(predictions, dict):
+                return predictions, 200
+
+            return predictions.to_dict(orient='records'), 200
+
+        # The answer only changes with the timetable week, the model version
+        # or the student's attendance rows (data version, bumped by ingestion)
+        key = ("attendance", json.dumps(prn), week_number, artifacts.version,
+               prediction_cache.data_version("attendance"))
+        predictions, status = await prediction_cache.get_or_compute(key, compute)
+        return jsonify(predictions), status
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
+
 
+@app.route('/predict-attendance/batch', methods=['POST'])
+async def predict_attendance_batch_api():
+    try:
+        input_data = await request.get_json()
+        prns = input_data.get("prns")
 
-async def schedule_attendance_processing():
-    await process_all_students()  
-    await train_and_save_model()  
+        if not prns or not isinstance(prns, list):
+            return jsonify({"error": "A list of PRNs is required"}), 400
+
+        if len(prns) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"At most {MAX_BATCH_SIZE} PRNs can be predicted per request"}), 400
+
+        # The latest timetable is shared by every student, so it is fetched once
+        week_data = await fetch_latest_timetable(prns[0])
+
+        if not week_data:
+            return jsonify({"error": "No timetable data found"}), 404
+
+        predictions = predict_attendance_batch(week_data, prns, await current_artifacts())
+
+        return jsonify({str(prn): result for prn, result in predictions.items()}), 200
+
+    except Exception as e:
+        return error_response(e)
+
+
+@app.route('/pipeline/status', methods=['GET'])
+def pipeline_status():
+    state = read_state()
+    holder = lock_holder()
+    state["running"] = holder is not None
+    state["lock_holder"] = holder
+    state["active_model_version"] = model_registry.stats()["version"]
+    return jsonify(state)
 
 def run_scheduled_task():
-    asyncio.run(schedule_attendance_processing())  
+    # Re-ingest + retrain run in their own (niced, lock-guarded) process so
+    # the server keeps its cores; the new version is loaded once it finishes
+    if pipeline_running():
+        print("Attendance pipeline already running, skipping this run")
+        return
+    env = dict(os.environ)
+    for var in ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"]:
+        env.setdefault(var, str(max(PIPELINE_N_JOBS, 1)))
+    # The run's own outcome and stage times are exported from its state file
+    with metrics.job("pipeline"):
+        subprocess.run([sys.executable, "-m", "scripts.run_pipeline"], env=env)
+    model_registry.reload()
+    prediction_cache.invalidate("attendance")
+
+def run_nightly_scoring():
+    # Refreshes the precomputed predictions (the pipeline also scores after retraining)
+    if pipeline_running():
+        return
+    env = dict(os.environ)
+    for var in ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"]:
+        env.setdefault(var, "1")
+    with metrics.job("scoring"):
+        subprocess.run([sys.executable, "-m", "scripts.score_all_students"], env=env)
+
+def run_model_reload():
+    # Also picks up a marks bundle written by scripts.retrain_marks_model
+    with metrics.job("model_reload"):
+        reloaded = model_registry.reload()
+        marks_reloaded = reload_marks_bundle()
+    if reloaded:
+        prediction_cache.invalidate("attendance")
+    if marks_reloaded:
+        prediction_cache.invalidate("marks")
+
+async def schedule_incremental_ingestion():
+    # Imported here so the ingestion stack (pyarrow store) isn't part of startup
+    from db.attendance_data_fetch import process_new_attendance
+    try:
+        return await process_new_attendance()
+    finally:
+        await close_decrypt_client()
+
+def run_incremental_ingestion():
+    # The full pipeline rewrites the same store, so the pipeline lock is held
+    # for the whole run (a pipeline started meanwhile exits)
+    lock = PipelineLock(holder="incremental_ingestion")
+    if not lock.acquire():
+        return
+    try:
+        # asyncio.run copies this thread's context, so the DB and decrypt
+        # stages are attributed to the job
+        with metrics.job("incremental_ingestion"):
+            result = asyncio.run(schedule_incremental_ingestion())
+            model_registry.apply_ingestion(result)
+    finally:
+        lock.release()
+    prediction_cache.invalidate("attendance")
+
+INCREMENTAL_INGEST_HOURS = int(os.getenv("INCREMENTAL_INGEST_HOURS", "24"))
+SCORING_HOUR = int(os.getenv("SCORING_HOUR", "2"))
 
 scheduler = BackgroundScheduler()
 scheduler.add_job(run_scheduled_task, "interval", weeks=5)  
-scheduler.start()
+# Only rows newer than the stored watermark are pulled, so this can run daily
+scheduler.add_job(run_incremental_ingestion, "interval", hours=INCREMENTAL_INGEST_HOURS)
+scheduler.add_job(run_nightly_scoring, "cron", hour=SCORING_HOUR)
+# Picks up artifacts published by a retrain outside this process
+scheduler.add_job(run_model_reload, "interval", minutes=MODEL_RELOAD_MINUTES)
+# Started with the server (before_serving), not at import
 # import uvicorn
 # if __name__ == '__main__':
 #     uvicorn.run("app:app", host="0.0.0.0", port=5000, reload=True)
\ No newline at end of file
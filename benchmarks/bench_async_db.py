@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import db.connection as connection
+from benchmarks.standin_db import create_standin_db, use_standin_db, write_table
+
+# Shows how blocking pd.read_sql on the event loop compares with
+# read_sql_async when many clients query the stand-in database at once.
+# A heartbeat task measures how late the loop wakes it up.
+
+QUERY = "SELECT DISTINCT student_id FROM psat_final.dbo.student_data"
+
+
+async def _heartbeat(stop, lags, interval=0.005):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def _blocking_query():
+    return pd.read_sql(QUERY, connection.get_db_engine())
+
+
+async def _async_query():
+    return await connection.read_sql_async(QUERY)
+
+
+async def _run_clients(query, clients, requests_per_client):
+    lags = []
+    stop = asyncio.Event()
+    heartbeat = asyncio.create_task(_heartbeat(stop, lags))
+    latencies = []
+
+    async def client():
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            await query()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await heartbeat
+
+    lags_ms = np.array(lags or [0.0]) * 1000
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "latency_p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "latency_p99_ms": round(float(np.percentile(latencies_ms, 99)), 2),
+        "loop_lag_p99_ms": round(float(np.percentile(lags_ms, 99)), 2),
+        "loop_lag_max_ms": round(float(lags_ms.max()), 2),
+    }
+
+
+async def run(clients, requests_per_client, latency, students):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = create_standin_db(os.path.join(tmp, "standin.db"))
+        write_table(path, "student_data", pd.DataFrame({"student_id": range(1, students + 1)}))
+        use_standin_db(path, latency=latency)
+        try:
+            return {
+                "clients": clients,
+                "requests_per_client": requests_per_client,
+                "query_latency_s": latency,
+                "executor_workers": connection.DB_EXECUTOR_WORKERS,
+                "blocking": await _run_clients(_blocking_query, clients, requests_per_client),
+                "read_sql_async": await _run_clients(_async_query, clients, requests_per_client),
+            }
+        finally:
+            connection.dispose_db_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Event-loop responsiveness under concurrent DB clients")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated seconds per query")
+    parser.add_argument("--students", type=int, default=1000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.clients, args.requests, args.latency, args.students)), indent=2))
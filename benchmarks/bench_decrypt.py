@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import json
+import time
+import aiohttp
+from db.utils.flask_security import DecryptClient, decrypted_value_cache, parse_encrypted_value
+from benchmarks.stub_decrypt_server import start_stub_server, stub_encrypt
+
+# Compares the old one-session-per-value decrypt loop with the pooled client
+# (fan-out, bulk and warm cache) against the local stub decrypt server.
+
+
+async def _legacy_decrypt(base_url, items):
+    decrypted = []
+    for encrypted_data, encrypted_aes_key in items:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                f"{base_url}/decrypt",
+                json={"encrypted_data": encrypted_data, "encrypted_aes_key": encrypted_aes_key},
+            ) as response:
+                response.raise_for_status()
+                decrypted.append((await response.json()).get("decrypted_data"))
+    return decrypted
+
+
+async def _measure(name, func, expected, stats, warm=False):
+    if not warm:
+        decrypted_value_cache.clear()
+    before = {key: stats[key] for key in ("decrypt_calls", "bulk_calls")}
+    start = time.perf_counter()
+    decrypted = await func()
+    elapsed = time.perf_counter() - start
+    assert decrypted == expected, f"{name} returned wrong plain text"
+    return {
+        "mode": name,
+        "seconds": round(elapsed, 4),
+        "decrypt_calls": stats["decrypt_calls"] - before["decrypt_calls"],
+        "bulk_calls": stats["bulk_calls"] - before["bulk_calls"],
+    }
+
+
+async def run(values, unique, latency):
+    runner, base_url, stats = await start_stub_server(latency=latency)
+    try:
+        names = [f"Teacher {i % unique}" for i in range(values)]
+        items = [parse_encrypted_value(stub_encrypt(name)) for name in names]
+
+        fan_out = DecryptClient(base_url=base_url, bulk_endpoint="")
+        bulk = DecryptClient(base_url=base_url, bulk_endpoint="decrypt-bulk")
+        try:
+            report = [
+                await _measure("legacy", lambda: _legacy_decrypt(base_url, items), names, stats),
+                await _measure("pooled_fan_out", lambda: fan_out.decrypt_many(items), names, stats),
+                await _measure("pooled_bulk", lambda: bulk.decrypt_many(items), names, stats),
+                await _measure("pooled_warm_cache", lambda: bulk.decrypt_many(items), names, stats, warm=True),
+            ]
+        finally:
+            await fan_out.close()
+            await bulk.close()
+    finally:
+        await runner.cleanup()
+    return {"values": values, "unique": unique, "latency": latency, "results": report}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark decrypt clients against the stub server")
+    parser.add_argument("--values", type=int, default=40)
+    parser.add_argument("--unique", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.005)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.values, args.unique, args.latency)), indent=2))
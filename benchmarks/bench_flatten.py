@@ -0,0 +1,92 @@
+import argparse
+import json
+import random
+import time
+import numpy as np
+import pandas as pd
+from services.attendance_predictions import _flatten_week
+from services.model_registry import load_artifacts
+
+# Times the timetable -> feature rows step of predict_attendance: the old
+# iterrows/to_datetime/LabelEncoder loop against the vectorised flattening.
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+TIMINGS = ['09:00:00 AM', '10:00:00 AM', '11:00:00 AM', '12:00:00 PM', '02:00:00 PM', '03:00:00 PM']
+
+
+def _legacy_flatten_week(week_data, artifacts):
+    week_df = pd.DataFrame(week_data)
+    week_df['day_name'] = artifacts.le_day.transform(week_df['day_name'])
+
+    flattened_data = []
+    for _, row in week_df.iterrows():
+        for subject, teacher, lecture_type, timing in zip(row['subject'], row['teacher'], row['lecture_type'], row['lecture_timing']):
+            flattened_data.append({
+                'prn': row['prn'],
+                'subject': subject,
+                'teacher': teacher,
+                'day_name': row['day_name'],
+                'lecture_type': lecture_type,
+                'time_in_minutes': pd.to_datetime(timing, format='%I:%M:%S %p').hour * 60,
+                'week_number': row['week_number']
+            })
+
+    flattened_df = pd.DataFrame(flattened_data)
+    flattened_df['subject'] = artifacts.le_subject.transform(flattened_df['subject'])
+    flattened_df['teacher'] = artifacts.le_teacher.transform(flattened_df['teacher'])
+    flattened_df['lecture_type'] = artifacts.le_lecture_type.transform(flattened_df['lecture_type'])
+    return flattened_df
+
+
+def make_week(artifacts, lectures_per_day, seed=0):
+    # A full week: every day has `lectures_per_day` lectures and timings
+    rnd = random.Random(seed)
+    subjects = artifacts.le_subject.classes_.tolist()
+    teachers = artifacts.le_teacher.classes_.tolist()
+    lecture_types = artifacts.le_lecture_type.classes_.tolist()
+    return {
+        "prn": [1001] * len(DAYS),
+        "subject": [[rnd.choice(subjects) for _ in range(lectures_per_day)] for _ in DAYS],
+        "teacher": [[rnd.choice(teachers) for _ in range(lectures_per_day)] for _ in DAYS],
+        "day_name": list(DAYS),
+        "lecture_type": [[rnd.choice(lecture_types) for _ in range(lectures_per_day)] for _ in DAYS],
+        "lecture_timing": [[rnd.choice(TIMINGS) for _ in range(lectures_per_day)] for _ in DAYS],
+        "week_number": [12] * len(DAYS),
+    }
+
+
+def _time(func, repeat):
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    timings_us = np.array(timings) * 1e6
+    return {
+        "p50_us": round(float(np.percentile(timings_us, 50)), 1),
+        "p99_us": round(float(np.percentile(timings_us, 99)), 1),
+    }
+
+
+def run(lectures_per_day, repeat):
+    artifacts = load_artifacts()
+    week_data = make_week(artifacts, lectures_per_day)
+
+    legacy = _legacy_flatten_week(week_data, artifacts)
+    vectorised = _flatten_week(week_data, artifacts)
+    assert legacy.equals(vectorised), "vectorised flattening differs from the legacy loop"
+
+    return {
+        "rows": len(vectorised),
+        "legacy": _time(lambda: _legacy_flatten_week(week_data, artifacts), repeat),
+        "vectorised": _time(lambda: _flatten_week(week_data, artifacts), repeat),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark of the week flattening step")
+    parser.add_argument("--lectures", type=int, default=8, help="lectures per day")
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+    print(json.dumps(run(args.lectures, args.repeat), indent=2))
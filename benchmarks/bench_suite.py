@@ -0,0 +1,310 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import db.utils.flask_security as flask_security
+from db.attendance_store import processed_store_exists, raw_store_exists
+from benchmarks.standin_db import use_standin_db
+from benchmarks.stub_decrypt_server import start_stub_server
+from benchmarks.synthetic_data import REPO_DIR, generate
+from services import metrics
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# End-to-end benchmark of the service without SQL Server or the Flask decrypt
+# service: synthetic data (benchmarks.synthetic_data) in a SQLite stand-in,
+# the stub decrypt server, and the production code paths on top.
+# Measured: process_all_students (full ingest), train_and_save_model, and
+# predict_attendance / predict_marks (fetch + predict per student, plus the
+# batch variants): throughput, latency percentiles, traced peak Python
+# memory and the per-stage breakdown from services.metrics.
+# Runs in a scratch copy of models/ so nothing in the repo is written.
+# Usage: python -m benchmarks.bench_suite [--students 1000] [--weeks 4]
+#        [--requests 200] [--output report.json] [--compare baseline.json]
+
+STAGES = ["ingest", "train", "attendance", "marks"]
+
+
+def _latency_report(samples, elapsed):
+    latencies_ms = np.asarray(samples) * 1000
+    return {
+        "calls": len(samples),
+        "throughput_per_second": round(len(samples) / elapsed, 1),
+        "latency_mean_ms": round(float(latencies_ms.mean()), 3),
+        "latency_p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "latency_p90_ms": round(float(np.percentile(latencies_ms, 90)), 3),
+        "latency_p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "latency_max_ms": round(float(latencies_ms.max()), 3),
+    }
+
+
+async def _timed(name, run):
+    # Wall time of one run and its stage breakdown (db, decrypt, model, ...)
+    with metrics.job(name) as scope:
+        start = time.perf_counter()
+        result = await run()
+        seconds = time.perf_counter() - start
+    breakdown = {stage: round(value, 3) for stage, value in scope.stages.items()} if scope is not None else {}
+    return result, seconds, breakdown
+
+
+async def _peak_memory_mb(run):
+    # Traced separately from the timed runs, tracemalloc slows them down.
+    # Counts Python and NumPy allocations of this process, not Arrow's own
+    # buffers or joblib workers.
+    tracemalloc.start()
+    try:
+        await run()
+        return round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+    finally:
+        tracemalloc.stop()
+
+
+async def bench_ingest(memory):
+    from db.attendance_data_fetch import process_all_students
+    df, seconds, breakdown = await _timed("process_all_students", process_all_students)
+    report = {"rows": len(df), "seconds": round(seconds, 3),
+              "rows_per_second": round(len(df) / seconds, 1), "breakdown": breakdown}
+    if memory:
+        report["peak_memory_mb"] = await _peak_memory_mb(process_all_students)
+    return report
+
+
+async def bench_train(memory):
+    import scripts.retrain_attendance_model as retrain
+    # Full search every time, so runs are comparable
+    retrain.TRAIN_WARM_START = False
+    training, seconds, breakdown = await _timed("train_and_save_model", retrain.train_and_save_model)
+    report = {"rows": training["rows"], "seconds": round(seconds, 3),
+              "rows_per_second": round(training["rows"] / seconds, 1),
+              "accuracy": training["accuracy"], "stages": training["stages"], "breakdown": breakdown}
+    if memory:
+        report["peak_memory_mb"] = await _peak_memory_mb(retrain.train_and_save_model)
+    return report
+
+
+async def bench_attendance(prns, requests, batch_size, memory):
+    from db.attendance_timetable_fetch import fetch_latest_timetable
+    from services.attendance_predictions import predict_attendance, predict_attendance_batch
+    from services.model_registry import model_registry
+
+    load_start = time.perf_counter()
+    artifacts = model_registry.current()
+    load_seconds = time.perf_counter() - load_start
+
+    async def one(prn):
+        week_data = await fetch_latest_timetable(prn)
+        try:
+            return predict_attendance(week_data, artifacts)
+        except ValueError as e:
+            return {"error": str(e)}
+
+    # The first call also loads the shared timetable
+    first_start = time.perf_counter()
+    await one(prns[0])
+    first_ms = (time.perf_counter() - first_start) * 1000
+
+    sample = random.Random(0).choices(prns, k=requests)
+    latencies = []
+    errors = []
+    async def run_single():
+        for prn in sample:
+            start = time.perf_counter()
+            result = await one(prn)
+            latencies.append(time.perf_counter() - start)
+            errors.append("error" in result)
+    _, seconds, breakdown = await _timed("predict_attendance", run_single)
+    report = {"model_load_seconds": round(load_seconds, 3), "first_call_ms": round(first_ms, 3),
+              **_latency_report(latencies, seconds), "errors": sum(errors), "breakdown": breakdown}
+
+    batch = prns[:batch_size]
+    async def run_batch():
+        week_data = await fetch_latest_timetable(batch[0])
+        return predict_attendance_batch(week_data, batch, artifacts)
+    predictions, batch_seconds, batch_breakdown = await _timed("predict_attendance_batch", run_batch)
+    report["batch"] = {"students": len(batch), "seconds": round(batch_seconds, 3),
+                       "errors": sum("error" in result for result in predictions.values()),
+                       "students_per_second": round(len(batch) / batch_seconds, 1), "breakdown": batch_breakdown}
+
+    if memory:
+        report["peak_memory_mb"] = await _peak_memory_mb(lambda: one(prns[0]))
+        report["batch"]["peak_memory_mb"] = await _peak_memory_mb(run_batch)
+    return report
+
+
+async def bench_marks(prns, requests, batch_size, memory):
+    from db.marks_data_fetch import fetch_student_data, fetch_students_data
+    from services.marks_predictions import get_marks_bundle, predict_marks, predict_marks_batch
+
+    load_start = time.perf_counter()
+    get_marks_bundle()
+    load_seconds = time.perf_counter() - load_start
+
+    async def one(prn):
+        student_data = await fetch_student_data(prn)
+        return predict_marks(student_data.to_dict(orient="records")[0])
+
+    # Distinct students, so every name goes to the decrypt server once
+    sample = random.Random(1).sample(prns, k=min(requests, len(prns)))
+    latencies = []
+    errors = []
+    async def run_single():
+        for prn in sample:
+            start = time.perf_counter()
+            result = await one(prn)
+            latencies.append(time.perf_counter() - start)
+            errors.append("error" in result)
+    _, seconds, breakdown = await _timed("predict_marks", run_single)
+    report = {"model_load_seconds": round(load_seconds, 3), **_latency_report(latencies, seconds),
+              "errors": sum(errors), "breakdown": breakdown}
+
+    batch = prns[-batch_size:]
+    async def run_batch():
+        return predict_marks_batch(await fetch_students_data(batch))
+    predictions, batch_seconds, batch_breakdown = await _timed("predict_marks_batch", run_batch)
+    report["batch"] = {"students": len(batch), "seconds": round(batch_seconds, 3),
+                       "errors": sum("error" in result for result in predictions),
+                       "students_per_second": round(len(batch) / batch_seconds, 1), "breakdown": batch_breakdown}
+
+    if memory:
+        report["peak_memory_mb"] = await _peak_memory_mb(lambda: one(prns[0]))
+        report["batch"]["peak_memory_mb"] = await _peak_memory_mb(run_batch)
+    return report
+
+
+def _environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "created_at": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def _max_rss_mb():
+    # KiB on Linux, bytes on macOS
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def compare(report, baseline, path=()):
+    # current / baseline for every numeric metric both reports have
+    ratios = {}
+    for key, value in report.items():
+        other = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict) and isinstance(other, dict):
+            ratios.update(compare(value, other, path + (key,)))
+        elif isinstance(value, (int, float)) and isinstance(other, (int, float)) and not isinstance(value, bool) and other:
+            ratios[".".join(path + (key,))] = round(value / other, 3)
+    return ratios
+
+
+async def run(students, weeks, requests, batch_size, stages, memory, db_latency, decrypt_latency, workdir, seed):
+    report = {"environment": _environment(), "config": {
+        "students": students, "weeks": weeks, "requests": requests, "batch_size": batch_size,
+        "stages": stages, "db_latency_s": db_latency, "decrypt_latency_s": decrypt_latency,
+        "decrypt_bulk_endpoint": flask_security.DECRYPT_BULK_ENDPOINT or None, "seed": seed,
+    }}
+
+    # Relative data/ and models/ paths resolve inside the scratch directory
+    os.makedirs(workdir, exist_ok=True)
+    shutil.copytree(os.path.join(REPO_DIR, "models"), os.path.join(workdir, "models"), dirs_exist_ok=True)
+    data = generate(os.path.join(workdir, "standin.db"), students, weeks, seed)
+    prns = data.pop("prns")
+    report["data"] = data
+    os.chdir(workdir)
+
+    # Later stages read what the earlier ones wrote (unless --workdir has it)
+    if "train" in stages and "ingest" not in stages and not raw_store_exists():
+        raise SystemExit("The train stage needs the ingest stage or a --workdir with an ingested store")
+    if "attendance" in stages and "train" not in stages and not processed_store_exists():
+        raise SystemExit("The attendance stage needs the train stage or a --workdir with a trained model")
+
+    runner, url, decrypt_stats = await start_stub_server(latency=decrypt_latency)
+    flask_security.FLASK_API_URL = url
+    use_standin_db(os.path.join(workdir, "standin.db"), latency=db_latency)
+
+    results = report["results"] = {}
+    try:
+        if "ingest" in stages:
+            print(f"process_all_students: {data['attendance_rows']} rows")
+            results["process_all_students"] = await bench_ingest(memory)
+        if "train" in stages:
+            print("train_and_save_model")
+            results["train_and_save_model"] = await bench_train(memory)
+        if "attendance" in stages:
+            print(f"predict_attendance: {requests} calls, batch of {min(batch_size, len(prns))}")
+            results["predict_attendance"] = await bench_attendance(prns, requests, batch_size, memory)
+        if "marks" in stages:
+            print(f"predict_marks: {min(requests, len(prns))} calls, batch of {min(batch_size, len(prns))}")
+            results["predict_marks"] = await bench_marks(prns, requests, batch_size, memory)
+    finally:
+        await flask_security.close_decrypt_client()
+        await runner.cleanup()
+
+    report["decrypt_server"] = {"decrypt_calls": decrypt_stats["decrypt_calls"],
+                                "bulk_calls": decrypt_stats["bulk_calls"], "values": decrypt_stats["values"]}
+    report["max_rss_mb"] = _max_rss_mb()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingest, training and predictions on synthetic data")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--weeks", type=int, default=4, help="weeks of attendance history per student")
+    parser.add_argument("--requests", type=int, default=200, help="single-student prediction calls")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"comma-separated subset of {','.join(STAGES)}")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced peak-memory runs")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="simulated seconds per query")
+    parser.add_argument("--decrypt-latency", type=float, default=0.0, help="simulated seconds per decrypt call")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", default=None, help="scratch directory (default: a temporary one)")
+    parser.add_argument("--output", default=None, help="write the JSON report here")
+    parser.add_argument("--compare", default=None, help="earlier report to compute current/baseline ratios against")
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_suite_")
+    try:
+        report = asyncio.run(run(args.students, args.weeks, args.requests, args.batch_size, stages,
+                                 not args.no_memory, args.db_latency, args.decrypt_latency, workdir, args.seed))
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            report["vs_baseline"] = compare(report["results"], json.load(f).get("results", {}))
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    print(text)
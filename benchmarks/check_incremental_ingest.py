@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import pandas as pd
+import db.utils.flask_security as flask_security
+from benchmarks.standin_db import create_standin_db, use_standin_db, write_table
+from benchmarks.stub_decrypt_server import start_stub_server, stub_encrypt
+from benchmarks.synthetic_data import ATTENDANCE_TEMPLATE
+
+# Consistency check for incremental attendance ingestion: a full ingest of
+# the source up to (part of) a cutoff day, then process_new_attendance against
+# the complete source, must leave the same raw store, watermark row count and
+# per-subject summary as a full ingest of the complete source.
+# Uses the committed attendance dataset (which has repeated lecture rows and
+# Theory/Practical pairs in the same slot), the SQLite stand-in and the stub
+# decrypt server; runs in a scratch directory.
+# Usage: python -m benchmarks.check_incremental_ingest [--cutoff 2025-03-14]
+
+
+def source_rows(cutoff=None, keep_cutoff_rows=0.5):
+    # Rows of the view; with a cutoff only earlier days and the first part of
+    # the cutoff day, as if it was read while still being filled in
+    template = pd.read_csv(ATTENDANCE_TEMPLATE)
+    rows = pd.DataFrame({
+        'prn': template['prn'],
+        'subject_name': template['subject'],
+        'teacher_name': template['teacher'].map(lambda name: stub_encrypt(name) if isinstance(name, str) else None),
+        'week_number': template['week_number'],
+        'day_name': template['day_name'],
+        'day_no': template['day_no'],
+        'lecture_type': template['lecture_type'],
+        'lecture_timing': template['lecture_timing'] + ':00',
+        'attendance': template['attendance'],
+        'festival': template['festival'].astype(str).str.upper().eq('TRUE').astype(int),
+        'date': template['date'],
+    })
+    if cutoff is None:
+        return rows
+    on_cutoff = (rows['date'] == cutoff).to_numpy()
+    partial_day = on_cutoff & (on_cutoff.cumsum() <= on_cutoff.sum() * keep_cutoff_rows)
+    return rows[(rows['date'] < cutoff).to_numpy() | partial_day].reset_index(drop=True)
+
+
+def _comparable(df):
+    # Row ids differ between the runs (appended vs numbered in one go)
+    df = df.drop(columns='row_id')
+    df = df.astype({col: str for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)})
+    return df.sort_values(list(df.columns), ignore_index=True)
+
+
+def _summary_rows(summary, prns):
+    return {prn: summary.lookup(prn) for prn in prns}
+
+
+async def run(db_path, cutoff):
+    from db.attendance_data_fetch import load_attendance_dataset, load_watermark, process_all_students, process_new_attendance
+    from services.model_registry import load_attendance_summary
+
+    create_standin_db(db_path)
+    source = source_rows()
+    prns = sorted(source['prn'].unique().tolist())
+    write_table(db_path, "student_data", pd.DataFrame({'student_id': prns}))
+    cutoff = cutoff or sorted(source['date'].unique())[len(source['date'].unique()) // 2]
+
+    write_table(db_path, "vw_student_attendance_details", source_rows(cutoff))
+    await process_all_students()
+    summary = load_attendance_summary()
+
+    write_table(db_path, "vw_student_attendance_details", source)
+    result = await process_new_attendance()
+    summary.apply(result["new_rows"], result["replaced_rows"])
+    incremental = load_attendance_dataset()
+    incremental_watermark = load_watermark()
+
+    await process_all_students()
+    full = load_attendance_dataset()
+
+    failures = []
+    if incremental_watermark["rows"] != len(incremental):
+        failures.append(f"watermark records {incremental_watermark['rows']} rows, store has {len(incremental)}")
+    if len(incremental) != len(full):
+        failures.append(f"incremental store has {len(incremental)} rows, full ingest {len(full)}")
+    elif not _comparable(incremental).equals(_comparable(full)):
+        failures.append("incremental and full stores hold different rows")
+    if _summary_rows(summary, prns) != _summary_rows(load_attendance_summary(), prns):
+        failures.append("attendance summary after apply differs from a recount")
+
+    print(f"cutoff {cutoff}: {result['rows_fetched']} rows fetched, {result['rows_refreshed']} replaced, "
+          f"{len(incremental)} incremental vs {len(full)} full")
+    return failures
+
+
+async def main(cutoff):
+    workdir = tempfile.mkdtemp(prefix="check_ingest_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    runner, url, _ = await start_stub_server()
+    flask_security.FLASK_API_URL = url
+    use_standin_db(os.path.join(workdir, "standin.db"))
+    try:
+        return await run(os.path.join(workdir, "standin.db"), cutoff)
+    finally:
+        await flask_security.close_decrypt_client()
+        await runner.cleanup()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check incremental ingestion against a full ingest")
+    parser.add_argument("--cutoff", default=None, help="date the first ingest stops at (default: the middle day)")
+    args = parser.parse_args()
+    failures = asyncio.run(main(args.cutoff))
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    print("OK" if not failures else f"{len(failures)} check(s) failed")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Cold-start report for the server: `import app` is run in a fresh
+# interpreter with -X importtime, and the slowest imports are listed.
+# Exits with status 1 when the import takes longer than the budget, so it
+# can guard cold start in CI.
+# Usage: python -m benchmarks.profile_startup [--budget 1.5] [--top 15] [--warm]
+
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "1.5"))
+
+WARM_UP_SNIPPET = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.warm_up_models()
+print(json.dumps({"import_seconds": round(imported - start, 3),
+                  "warm_up_seconds": round(time.perf_counter() - imported, 3),
+                  "models": app.model_states(), "error": app._warmup["error"]}))
+"""
+
+
+def _parse_importtime(stderr):
+    # "import time: self [us] | cumulative | imported package" -> rows
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append({"module": name.strip(), "depth": depth,
+                     "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    return rows
+
+
+def profile_import(module="app"):
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               capture_output=True, text=True)
+    wall_seconds = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    return _parse_importtime(completed.stderr), wall_seconds
+
+
+def profile_warm_up():
+    completed = subprocess.run([sys.executable, "-c", WARM_UP_SNIPPET], capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"warm-up failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run(budget, top, warm):
+    rows, wall_seconds = profile_import()
+    root = next(row for row in rows if row["module"] == "app" and row["depth"] == 0)
+    # Direct imports of app, by the time they (and their dependencies) took
+    direct = sorted((row for row in rows if row["depth"] == 1), key=lambda row: -row["cumulative_ms"])
+    slowest = sorted(rows, key=lambda row: -row["self_ms"])
+
+    report = {
+        "import_seconds": round(root["cumulative_ms"] / 1000, 3),
+        "interpreter_wall_seconds": round(wall_seconds, 3),
+        "budget_seconds": budget,
+        "within_budget": root["cumulative_ms"] / 1000 <= budget,
+        "modules_imported": len(rows),
+        "app_imports": [{"module": row["module"], "cumulative_ms": round(row["cumulative_ms"], 1)} for row in direct[:top]],
+        "slowest_modules": [{"module": row["module"], "self_ms": round(row["self_ms"], 1)} for row in slowest[:top]],
+    }
+    if warm:
+        report["warm_up"] = profile_warm_up()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time profile of the server")
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET_SECONDS, help="seconds allowed for `import app`")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--warm", action="store_true", help="also time loading every model family")
+    args = parser.parse_args()
+
+    report = run(args.budget, args.top, args.warm)
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["within_budget"] else 1)
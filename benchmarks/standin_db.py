@@ -0,0 +1,101 @@
+import re
+import sqlite3
+import time
+from sqlalchemy import event
+import db.connection as connection
+
+# Local SQLite stand-in for the psat_final SQL Server views. Queries are
+# rewritten on the fly (three-part names and %s placeholders), so the
+# production fetch functions run unchanged against it.
+
+TABLES = {
+    "student_data": """
+        CREATE TABLE IF NOT EXISTS student_data (
+            student_id INTEGER PRIMARY KEY
+        )""",
+    "vw_student_attendance_details": """
+        CREATE TABLE IF NOT EXISTS vw_student_attendance_details (
+            prn INTEGER,
+            subject_name TEXT,
+            teacher_name TEXT,
+            week_number INTEGER,
+            day_name TEXT,
+            day_no INTEGER,
+            lecture_type TEXT,
+            lecture_timing TEXT,
+            attendance INTEGER,
+            festival INTEGER,
+            date TEXT
+        )""",
+    "vw_latest_timetable": """
+        CREATE TABLE IF NOT EXISTS vw_latest_timetable (
+            time_table_id INTEGER,
+            subject_id INTEGER,
+            subject_name TEXT,
+            teacher_fullname TEXT,
+            lecture_type TEXT,
+            day_name TEXT,
+            lecture_timing TEXT,
+            week_number INTEGER
+        )""",
+    "student_academic_summary": """
+        CREATE TABLE IF NOT EXISTS student_academic_summary (
+            prn INTEGER PRIMARY KEY,
+            student_full_name TEXT,
+            current_sem INTEGER,
+            sem_1_attendance_perc REAL, sem_1_marks_total REAL, sem_1_obtainable_total REAL,
+            sem_2_attendance_perc REAL, sem_2_marks_total REAL, sem_2_obtainable_total REAL,
+            sem_3_attendance_perc REAL, sem_3_marks_total REAL, sem_3_obtainable_total REAL,
+            sem_4_attendance_perc REAL, sem_4_marks_total REAL, sem_4_obtainable_total REAL,
+            sem_5_attendance_perc REAL, sem_5_marks_total REAL, sem_5_obtainable_total REAL,
+            sem_6_attendance_perc REAL, sem_6_marks_total REAL, sem_6_obtainable_total REAL
+        )""",
+}
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_attendance_prn ON vw_student_attendance_details (prn)",
+    "CREATE INDEX IF NOT EXISTS ix_attendance_date ON vw_student_attendance_details (date)",
+    "CREATE INDEX IF NOT EXISTS ix_timetable_week ON vw_latest_timetable (week_number)",
+]
+
+_THREE_PART_NAME = re.compile(r"\[?psat_final\]?\.\[?dbo\]?\.", re.IGNORECASE)
+# SQLite would turn CAST('2025-01-10' AS DATE) into the number 2025
+_CAST_AS_DATE = re.compile(r"CAST\((\w+) AS DATE\)", re.IGNORECASE)
+
+
+def create_standin_db(path):
+    with sqlite3.connect(path) as conn:
+        for ddl in TABLES.values():
+            conn.execute(ddl)
+        for ddl in INDEXES:
+            conn.execute(ddl)
+    return path
+
+
+def write_table(path, table, df):
+    # Replaces the rows of one stand-in table with a DataFrame
+    with sqlite3.connect(path) as conn:
+        conn.execute(f"DELETE FROM {table}")
+        df.to_sql(table, conn, if_exists="append", index=False)
+
+
+def _rewrite_sql(statement):
+    statement = _THREE_PART_NAME.sub("", statement)
+    statement = _CAST_AS_DATE.sub(r"\1", statement)
+    return statement.replace("%s", "?")
+
+
+def use_standin_db(path, latency=0.0):
+    # Points db.connection at the SQLite file; `latency` seconds are slept in
+    # the worker thread before every query to mimic a remote SQL Server.
+    connection.dispose_db_engine()
+    connection.DB_URL = f"sqlite:///{path}"
+    engine = connection.get_db_engine()
+
+    @event.listens_for(engine, "before_cursor_execute", retval=True)
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if latency:
+            time.sleep(latency)
+        return _rewrite_sql(statement), parameters
+
+    return engine
@@ -0,0 +1,75 @@
+import argparse
+import asyncio
+import base64
+import json
+from aiohttp import web
+
+# Local stand-in for the Flask encryption service. "Encrypted" values are just
+# base64 of the plain text, which is enough to exercise the decrypt clients.
+
+
+def stub_encrypt(plain_text):
+    return json.dumps({
+        "final_data": base64.b64encode(plain_text.encode()).decode(),
+        "encrypted_aes_key": "stub-key"
+    })
+
+
+def _stub_decrypt(encrypted_data):
+    return base64.b64decode(encrypted_data.encode()).decode()
+
+
+def create_app(latency=0.0, bulk=True):
+    stats = {"decrypt_calls": 0, "bulk_calls": 0, "values": 0, "connections": set()}
+
+    def _track(request):
+        peer = request.transport.get_extra_info("peername") if request.transport else None
+        stats["connections"].add(peer)
+
+    async def decrypt(request):
+        _track(request)
+        body = await request.json()
+        stats["decrypt_calls"] += 1
+        stats["values"] += 1
+        if latency:
+            await asyncio.sleep(latency)
+        return web.json_response({"decrypted_data": _stub_decrypt(body["encrypted_data"])})
+
+    async def decrypt_bulk(request):
+        _track(request)
+        body = await request.json()
+        stats["bulk_calls"] += 1
+        stats["values"] += len(body["items"])
+        if latency:
+            await asyncio.sleep(latency)
+        return web.json_response({
+            "decrypted_data": [_stub_decrypt(item["encrypted_data"]) for item in body["items"]]
+        })
+
+    app = web.Application()
+    app["stats"] = stats
+    app.router.add_post("/decrypt", decrypt)
+    if bulk:
+        app.router.add_post("/decrypt-bulk", decrypt_bulk)
+    return app
+
+
+async def start_stub_server(host="127.0.0.1", port=0, latency=0.0, bulk=True):
+    # Returns (runner, base_url, stats); call runner.cleanup() when done
+    app = create_app(latency=latency, bulk=bulk)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{bound_port}", app["stats"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a stub decrypt server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every call")
+    parser.add_argument("--no-bulk", action="store_true", help="don't serve /decrypt-bulk")
+    args = parser.parse_args()
+    web.run_app(create_app(latency=args.latency, bulk=not args.no_bulk), host=args.host, port=args.port)
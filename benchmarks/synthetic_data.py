@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from benchmarks.standin_db import create_standin_db, write_table
+from benchmarks.stub_decrypt_server import stub_encrypt
+
+# Synthetic attendance, timetable and academic-summary tables at any number
+# of students, shaped after the committed datasets:
+# - every student follows the lecture schedule of the last `weeks` weeks of
+#   data/attendance/attendance_dataset.csv (one student's history), with a
+#   per-student attendance rate around the real one and a per-subject offset
+# - the latest timetable is the last of those weeks
+# - academic summaries are rows of data/marks/realistic_student_data.xlsx,
+#   resampled with a little noise
+# Teacher and student names are "encrypted" for the stub decrypt server.
+# Usage: python -m benchmarks.synthetic_data --students 1000 --weeks 4 --db /tmp/standin.db
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ATTENDANCE_TEMPLATE = os.path.join(REPO_DIR, "data", "attendance", "attendance_dataset.csv")
+MARKS_TEMPLATE = os.path.join(REPO_DIR, "data", "marks", "realistic_student_data.xlsx")
+
+FIRST_PRN = 1001
+# Same per-semester maximums the marks model is trained with
+MAX_MARKS = {1: 1000, 2: 1000, 3: 1000, 4: 1000, 5: 800, 6: 800}
+
+
+def _schedule(weeks):
+    template = pd.read_csv(ATTENDANCE_TEMPLATE)
+    last_weeks = sorted(template['week_number'].unique())[-weeks:]
+    return template[template['week_number'].isin(last_weeks)].reset_index(drop=True)
+
+
+def attendance_rows(prns, schedule, rng):
+    # One row per (student, scheduled lecture)
+    rate = schedule['attendance'].mean()
+    # Beta around the real rate, then a shared per-subject shift on the logit
+    student_rate = rng.beta(rate * 10, (1 - rate) * 10, size=len(prns)).clip(0.02, 0.98)
+    subjects = schedule['subject'].unique()
+    subject_shift = dict(zip(subjects, rng.normal(0, 0.5, size=len(subjects))))
+
+    logit = np.log(student_rate / (1 - student_rate))
+    shift = schedule['subject'].map(subject_shift).to_numpy()
+    probability = 1 / (1 + np.exp(-(logit[:, None] + shift[None, :])))
+    attended = rng.random(probability.shape) < probability
+
+    teachers = schedule['teacher'].map(lambda name: stub_encrypt(name) if isinstance(name, str) else None)
+    rows = len(schedule)
+    return pd.DataFrame({
+        'prn': np.repeat(np.asarray(prns, dtype=np.int64), rows),
+        'subject_name': np.tile(schedule['subject'].to_numpy(), len(prns)),
+        'teacher_name': np.tile(teachers.to_numpy(dtype=object), len(prns)),
+        'week_number': np.tile(schedule['week_number'].to_numpy(), len(prns)),
+        'day_name': np.tile(schedule['day_name'].to_numpy(), len(prns)),
+        'day_no': np.tile(schedule['day_no'].to_numpy(), len(prns)),
+        'lecture_type': np.tile(schedule['lecture_type'].to_numpy(), len(prns)),
+        'lecture_timing': np.tile((schedule['lecture_timing'] + ':00').to_numpy(), len(prns)),
+        'attendance': attended.ravel().astype(np.int64),
+        'festival': np.tile(schedule['festival'].astype(int).to_numpy(), len(prns)),
+        'date': np.tile(schedule['date'].to_numpy(), len(prns)),
+    })
+
+
+def timetable_rows(schedule):
+    # The view serves the latest week only
+    week = schedule[schedule['week_number'] == schedule['week_number'].max()]
+    week = week.drop_duplicates(subset=['day_name', 'lecture_timing', 'subject']).reset_index(drop=True)
+    return pd.DataFrame({
+        'time_table_id': np.arange(1, len(week) + 1),
+        'subject_id': pd.factorize(week['subject'])[0] + 1,
+        'subject_name': week['subject'],
+        'teacher_fullname': week['teacher'].fillna(week['teacher'].mode()[0]).map(stub_encrypt),
+        'lecture_type': week['lecture_type'],
+        'day_name': week['day_name'],
+        'lecture_timing': week['lecture_timing'] + ':00',
+        'week_number': week['week_number'],
+    })
+
+
+def summary_rows(prns, rng):
+    template = pd.read_excel(MARKS_TEMPLATE)
+    sample = template.iloc[rng.integers(0, len(template), size=len(prns))].reset_index(drop=True)
+
+    summary = pd.DataFrame({
+        'prn': np.asarray(prns, dtype=np.int64),
+        'student_full_name': [stub_encrypt(f"{name} {prn}") for name, prn in zip(sample['name'], prns)],
+        'current_sem': sample['current_sem'],
+    })
+    for sem in range(1, 7):
+        completed = sample['current_sem'] >= sem
+        attendance = sample[f'sem_{sem}_attendance_perc'] + rng.normal(0, 3, size=len(sample))
+        marks = sample[f'sem_{sem}_marks_total'] + rng.normal(0, 15, size=len(sample))
+        summary[f'sem_{sem}_attendance_perc'] = attendance.clip(0, 100).round(1)
+        summary[f'sem_{sem}_marks_total'] = marks.clip(0, MAX_MARKS[sem]).round()
+        summary[f'sem_{sem}_obtainable_total'] = np.where(completed, MAX_MARKS[sem], np.nan)
+    return summary
+
+
+def generate(path, students, weeks=4, seed=42):
+    # Writes every stand-in table; returns row counts and the PRNs
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    prns = list(range(FIRST_PRN, FIRST_PRN + students))
+    schedule = _schedule(weeks)
+
+    create_standin_db(path)
+    write_table(path, "student_data", pd.DataFrame({'student_id': prns}))
+    attendance = attendance_rows(prns, schedule, rng)
+    write_table(path, "vw_student_attendance_details", attendance)
+    timetable = timetable_rows(schedule)
+    write_table(path, "vw_latest_timetable", timetable)
+    summary = summary_rows(prns, rng)
+    write_table(path, "student_academic_summary", summary)
+
+    return {
+        "students": students,
+        "weeks": weeks,
+        "seed": seed,
+        "attendance_rows": len(attendance),
+        "timetable_rows": len(timetable),
+        "summary_rows": len(summary),
+        "generate_seconds": round(time.perf_counter() - start, 3),
+        "prns": prns,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic data into a SQLite stand-in database")
+    parser.add_argument("--db", required=True, help="SQLite file to (re)write")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--weeks", type=int, default=4, help="weeks of attendance history per student")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    info = generate(args.db, args.students, args.weeks, args.seed)
+    info.pop("prns")
+    print(json.dumps(info, indent=2))
@@ -1,65 +1,24 @@
-import pandas as pd
-from db.connection import get_db_engine
-from db.utils.flask_security import call_flask_decrypt_api
+import asyncio
 import json
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from db.connection import read_sql_async
+from db.utils.flask_security import decrypt_json_values
+from db.attendance_store import next_row_id, read_raw_attendance, to_raw_schema, write_raw_attendance
 
-async def fetch_subject_teacher_mapping(prn):
-    engine = get_db_engine()
-    query = """
-        SELECT prn,
-            subject_name,
-            teacher_name,
-            week_number,
-            day_name,
-            day_no,
-            lecture_type,
-            lecture_timing,
-            attendance,
-            festival,
-            date
-        FROM psat_final.dbo.vw_student_attendance_details
-        WHERE prn = %s AND teacher_name IS NOT NULL
-    """
-    
-    df = pd.read_sql(query, engine, params=(prn,))
-    
-    # Rename columns as necessary at the start of the function
-    df.rename(columns={
-        "subject_name": "subject",
-        "teacher_name": "teacher"
-    }, inplace=True)
-    
-    subject_teacher_mapping = df[['subject', 'teacher']].drop_duplicates()
-
-    decrypted_teacher_names = []
-    for index, row in subject_teacher_mapping.iterrows():
-        encrypted_data = row['teacher']
-        
-        encrypted_data_json = json.loads(encrypted_data)
-        final_data = encrypted_data_json['final_data']
-        encrypted_aes_key = encrypted_data_json['encrypted_aes_key']
-        
-        decrypted_name = await call_flask_decrypt_api(final_data, encrypted_aes_key)
-        
-        decrypted_teacher_names.append(decrypted_name)
-
-    subject_teacher_mapping['teacher'] = decrypted_teacher_names
-
-    return df, subject_teacher_mapping[['subject', 'teacher']]
-
-async def fill_missing_teacher_names(df, prn):
-    original_df, subject_teacher_mapping = await fetch_subject_teacher_mapping(prn)
-    
-    teacher_mapping_dict = subject_teacher_mapping.set_index('subject')['teacher'].to_dict()
-    
-    # Ensure the column names match when applying the mapping
-    df['teacher'] = df.apply(lambda row: teacher_mapping_dict.get(row['subject'], row['teacher']), axis=1)
-    
-    return df
+INGEST_WATERMARK_FILE = os.path.join("data", "attendance", "ingest_watermark.json")
 
-async def getFinalAttendance(prn):
-    engine = get_db_engine()
-    query = """
+# Bulk ingestion: 0 pulls every student in one set-based query, a positive
+# value fetches PRN chunks of that size with INGEST_CONCURRENCY queries in flight.
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "0"))
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+
+ATTENDANCE_COLUMNS = ['prn', 'subject', 'teacher', 'week_number', 'day_name', 'day_no',
+                      'lecture_type', 'lecture_timing', 'attendance', 'festival', 'date']
+
+ATTENDANCE_QUERY = """
         SELECT prn,
             subject_name,
             teacher_name,
@@ -72,14 +31,29 @@ async def getFinalAttendance(prn):
             festival,
             CAST(date AS DATE) AS date  -- Converts datetime to date
         FROM psat_final.dbo.vw_student_attendance_details
-        WHERE prn = %s
-    """
-    
-    df = pd.read_sql(query, engine, params=(prn,))
+"""
+
+async def fetch_attendance_rows(prns=None, since=None):
+    conditions = []
+    params = []
+    if prns is None:
+        conditions.append("prn IN (SELECT student_id FROM psat_final.dbo.student_data)")
+    else:
+        conditions.append(f"prn IN ({', '.join(['%s'] * len(prns))})")
+        params.extend(prns)
+
+    if since is not None:
+        conditions.append("date >= %s")
+        params.append(since)
+
+    query = ATTENDANCE_QUERY + " WHERE " + " AND ".join(conditions)
+    df = await read_sql_async(query, params=tuple(params) if params else None)
 
     # Rename columns for consistency
     df.rename(columns={"subject_name": "subject", "teacher_name": "teacher"}, inplace=True)
+    return df
 
+def format_attendance(df):
     # Convert attendance (True → 1, False → 0)
     df['attendance'] = df['attendance'].apply(lambda x: 1 if x else 0)
 
@@ -92,24 +66,172 @@ async def getFinalAttendance(prn):
     # Convert lecture timing format from HH:MM:SS to HH:MM
     df['lecture_timing'] = pd.to_datetime(df['lecture_timing'], format='%H:%M:%S').dt.strftime('%H:%M')
 
+    return df
+
+async def fill_missing_teacher_names(df):
+    # Every (prn, subject) gets the teacher recorded for it (the last distinct
+    # one, as before). Each distinct encrypted teacher is decrypted only once.
+    subject_teacher_mapping = (
+        df.loc[df['teacher'].notna(), ['prn', 'subject', 'teacher']]
+        .drop_duplicates()
+        .drop_duplicates(subset=['prn', 'subject'], keep='last')
+    )
+    subject_teacher_mapping['teacher'] = await decrypt_json_values(subject_teacher_mapping['teacher'])
+
+    mapped = df[['prn', 'subject']].merge(subject_teacher_mapping, on=['prn', 'subject'], how='left')['teacher']
+    df['teacher'] = np.where(mapped.notna().to_numpy(), mapped.to_numpy(), df['teacher'].to_numpy())
+    return df
+
+def save_attendance_dataset(df, weeks=None):
+    # Written to the columnar store; with `weeks` only those partitions are replaced
+    write_raw_attendance(df, weeks=weeks)
+    print(f"Attendance data saved ({len(df)} rows)")
+
+def load_attendance_dataset(columns=None, weeks=None):
+    return read_raw_attendance(columns=columns, weeks=weeks)
+
+def load_watermark(file_path=None):
+    file_path = file_path or INGEST_WATERMARK_FILE
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path) as f:
+        return json.load(f)
+
+def save_watermark(df, rows=None, previous=None, file_path=None):
+    # `df` may hold only part of the dataset (the weeks an incremental run
+    # touched), so the previous watermark is carried forward
+    file_path = file_path or INGEST_WATERMARK_FILE
+    if df.empty:
+        return None
+
+    date = pd.Timestamp(df['date'].max()).strftime('%Y-%m-%d')
+    week_number = int(df['week_number'].max())
+    if previous is not None:
+        date = max(date, previous["date"])
+        week_number = max(week_number, previous["week_number"])
+
+    watermark = {
+        "date": date,
+        "week_number": week_number,
+        "rows": int(len(df) if rows is None else rows),
+        "updated_at": datetime.now().isoformat(timespec='seconds')
+    }
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(watermark, f)
+    os.replace(tmp_path, file_path)
+    return watermark
+
+async def getFinalAttendance(prn):
+    df = format_attendance(await fetch_attendance_rows([prn]))
+
     # Fill missing teacher names
-    updated_df = await fill_missing_teacher_names(df, prn)
-    
-    # Save the formatted DataFrame to a CSV file
-    file_path = f"data/attendance/attendance_dataset.csv"
-    updated_df.to_csv(file_path, index=False)  # Save CSV without row index
-    
-    print(f"Attendance data saved to {file_path}")
+    updated_df = await fill_missing_teacher_names(df)
+
+    # All of this student's rows are re-read, so all stored ones are replaced;
+    # only the weeks holding them are rewritten
+    stored = load_attendance_dataset(columns=['prn', 'week_number', 'date'])
+    _replace_in_store(updated_df, lambda rows: rows['prn'] == int(prn), stored)
     return "Data Loaded!"
 
 async def fetch_unique_prns():
-    engine = get_db_engine()
     query = "SELECT DISTINCT student_id FROM psat_final.dbo.student_data"
-    df = pd.read_sql(query, engine)
+    df = await read_sql_async(query)
     return df['student_id'].tolist()
 
-async def process_all_students():
+async def _fetch_all_attendance(chunk_size, concurrency):
+    if chunk_size <= 0:
+        return await fetch_attendance_rows()
+
     prns = await fetch_unique_prns()
-    for prn in prns:
-        await getFinalAttendance(prn)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch_chunk(chunk):
+        async with semaphore:
+            return await fetch_attendance_rows(chunk)
+
+    chunks = [prns[i:i + chunk_size] for i in range(0, len(prns), chunk_size)]
+    frames = await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks))
+    if not frames:
+        return pd.DataFrame(columns=ATTENDANCE_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+async def process_all_students(chunk_size=None, concurrency=None):
+    chunk_size = INGEST_CHUNK_SIZE if chunk_size is None else chunk_size
+    concurrency = concurrency or INGEST_CONCURRENCY
+
+    df = format_attendance(await _fetch_all_attendance(chunk_size, concurrency))
+    df = await fill_missing_teacher_names(df)
+
+    # One combined dataset for every student
+    df = to_raw_schema(df)
+    save_attendance_dataset(df)
+    save_watermark(df)
+    return df
+
+def replace_attendance(existing, new_rows, stale):
+    # The stored rows a fetch re-read (`stale` mask) are dropped and the
+    # fetched rows appended as they are. Rows are not matched by key: the
+    # same (prn, date, slot, subject) can hold a Theory and a Practical
+    # lecture, or repeated rows, which the full ingest keeps too.
+    # Returns the new dataset and the stored rows that were replaced.
+    replaced = existing[stale]
+    combined = pd.concat([existing[~stale], new_rows], ignore_index=True)
+    return combined, replaced
+
+def _replace_in_store(new_rows, select, stored):
+    # Reads and rewrites only the week partitions the fetched rows or the
+    # replaced ones fall into. select(df) marks the stored rows the fetch
+    # re-read; `stored` (prn, week_number, date at least) locates them.
+    # New rows are numbered after the stored ones, i.e. appended.
+    new_rows = to_raw_schema(new_rows, first_row_id=next_row_id())
+    weeks = set(new_rows['week_number'].tolist())
+    if stored is not None:
+        weeks.update(stored.loc[select(stored), 'week_number'].tolist())
+    weeks = sorted(int(week) for week in weeks)
+    existing = load_attendance_dataset(weeks=weeks)
+    if existing is None:
+        existing = new_rows.iloc[0:0]
+    combined, replaced = replace_attendance(existing, new_rows, select(existing).to_numpy())
+    save_attendance_dataset(combined, weeks=weeks)
+    return combined, new_rows, replaced, len(combined) - len(existing)
+
+async def process_new_attendance():
+    # Incremental ingestion: only rows on or after the stored watermark date
+    # are pulled (the watermark day itself is re-read in case it was partial)
+    # and replace the stored rows of that window.
+    stored = load_attendance_dataset(columns=['prn', 'subject', 'teacher', 'week_number', 'date'])
+    watermark = load_watermark()
+    if stored is None or watermark is None:
+        df = await process_all_students()
+        # No deltas: the attendance summary is recounted from the new store
+        return {"mode": "full", "rows_fetched": len(df), "rows_added": len(df), "rows_refreshed": 0,
+                "watermark": load_watermark(), "new_rows": None, "replaced_rows": None}
+
+    new_rows = format_attendance(await fetch_attendance_rows(since=watermark["date"]))
+    new_rows = await fill_missing_teacher_names(new_rows)
+
+    # Teachers only recorded on older lectures come from the stored dataset
+    missing_teacher = new_rows['teacher'].isna()
+    if missing_teacher.any():
+        known_teachers = (
+            stored.loc[stored['teacher'].notna()]
+            .astype({'subject': str, 'teacher': str})
+            .drop_duplicates(subset=['prn', 'subject'], keep='last')
+        )
+        mapped = new_rows[['prn', 'subject']].merge(known_teachers, on=['prn', 'subject'], how='left')['teacher']
+        new_rows['teacher'] = np.where(missing_teacher.to_numpy(), mapped.to_numpy(), new_rows['teacher'].to_numpy())
 
+    rows_added, replaced = 0, new_rows.iloc[0:0]
+    if not new_rows.empty:
+        since = pd.Timestamp(watermark["date"])
+        combined, new_rows, replaced, rows_added = _replace_in_store(
+            new_rows, lambda rows: rows['date'] >= since, stored)
+        total_rows = len(stored) + rows_added
+        watermark = save_watermark(combined, rows=total_rows, previous=watermark) or watermark
+    print(f"Incremental ingestion: {len(new_rows)} rows fetched, {rows_added} added, {len(replaced)} refreshed")
+    # The fetched rows and the stored ones they replaced, for the running
+    # attendance summary (services.attendance_summary)
+    return {"mode": "incremental", "rows_fetched": len(new_rows), "rows_added": rows_added,
+            "rows_refreshed": len(replaced), "watermark": watermark,
+            "new_rows": new_rows, "replaced_rows": replaced}
@@ -0,0 +1,228 @@
+import os
+import shutil
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from services.attendance_features import TREND_COLUMNS
+
+# Columnar (Parquet) storage for the raw and processed attendance datasets.
+# Both are partitioned by week_number so incremental ingestion only rewrites
+# the weeks it touched, and readers can project columns and weeks. row_id
+# keeps the insertion order, which partitioning would otherwise lose (the
+# training split depends on it).
+
+STORE_DIR = os.getenv("ATTENDANCE_STORE_DIR", os.path.join("data", "attendance", "store"))
+RAW_STORE = os.path.join(STORE_DIR, "raw")
+PROCESSED_STORE = os.path.join(STORE_DIR, "processed")
+
+# Legacy CSV files, converted the first time a store is read
+RAW_CSV = os.path.join("data", "attendance", "attendance_dataset.csv")
+PROCESSED_CSV = os.path.join("data", "attendance", "processed", "processed_attendance_dataset.csv")
+
+_category = pa.dictionary(pa.int16(), pa.string())
+
+RAW_SCHEMA = pa.schema([
+    ("row_id", pa.uint32()),
+    ("prn", pa.int32()),
+    ("subject", _category),
+    ("teacher", _category),
+    ("week_number", pa.int16()),
+    ("day_name", _category),
+    ("day_no", pa.uint8()),
+    ("lecture_type", _category),
+    ("time_in_minutes", pa.uint16()),
+    ("attendance", pa.bool_()),
+    ("festival", pa.bool_()),
+    ("date", pa.timestamp("ns")),
+])
+
+# Label-encoded categoricals are small ints once processed
+PROCESSED_SCHEMA = pa.schema([
+    ("row_id", pa.uint32()),
+    ("prn", pa.int32()),
+    ("subject", pa.int16()),
+    ("teacher", pa.int16()),
+    ("week_number", pa.int16()),
+    ("day_name", pa.int16()),
+    ("day_no", pa.uint8()),
+    ("lecture_type", pa.int16()),
+    ("time_in_minutes", pa.uint16()),
+    ("attendance", pa.bool_()),
+    ("festival", pa.int16()),
+    ("date", pa.timestamp("ns")),
+    ("weekday", _category),
+    ("attendance_percentage", pa.int16()),
+] + [(col, pa.float64()) for col in TREND_COLUMNS])
+
+_PARTITIONING = ds.partitioning(pa.schema([("week_number", pa.int16())]), flavor="hive")
+
+
+def _minutes_from_timing(lecture_timing):
+    # "11:00" (raw CSV), "11:00:00" or "1900-01-01 11:00:00" (processed CSV)
+    timings = pd.Series(lecture_timing).astype(str)
+    unique = timings.unique()
+    parsed = pd.to_datetime(pd.Series(unique).str.slice(-8).str.strip(), format='mixed')
+    minutes = dict(zip(unique, (parsed.dt.hour * 60 + parsed.dt.minute).tolist()))
+    return timings.map(minutes).astype('uint16')
+
+
+def _to_bool(values):
+    return pd.Series(values).astype(str).str.upper().isin(["TRUE", "1"])
+
+
+def _row_ids(df, first_row_id=0):
+    if 'row_id' in df.columns:
+        return df['row_id'].astype('uint32')
+    return pd.Series(range(first_row_id, first_row_id + len(df)), index=df.index, dtype='uint32')
+
+
+def to_raw_schema(df, first_row_id=0):
+    # Converts an ingestion frame (string dates/timings/"TRUE" flags) to the
+    # compact raw schema. Rows without a row_id are numbered from first_row_id.
+    out = pd.DataFrame(index=df.index)
+    out['row_id'] = _row_ids(df, first_row_id)
+    out['prn'] = df['prn'].astype('int32')
+    for col in ['subject', 'teacher', 'day_name', 'lecture_type']:
+        out[col] = df[col].astype('category')
+    out['week_number'] = df['week_number'].astype('int16')
+    out['day_no'] = df['day_no'].astype('uint8')
+    if 'time_in_minutes' in df.columns:
+        out['time_in_minutes'] = df['time_in_minutes'].astype('uint16')
+    else:
+        out['time_in_minutes'] = _minutes_from_timing(df['lecture_timing']).to_numpy()
+    out['attendance'] = df['attendance'].astype(bool)
+    out['festival'] = _to_bool(df['festival']).to_numpy()
+    out['date'] = pd.to_datetime(df['date']).astype('datetime64[ns]')
+    return out.reset_index(drop=True)
+
+
+def to_processed_schema(df):
+    out = pd.DataFrame(index=df.index)
+    for field in PROCESSED_SCHEMA:
+        col = field.name
+        if col == 'row_id':
+            out[col] = _row_ids(df)
+        elif col == 'time_in_minutes' and col not in df.columns:
+            out[col] = _minutes_from_timing(df['lecture_timing']).to_numpy()
+        elif col == 'date':
+            out[col] = pd.to_datetime(df[col]).astype('datetime64[ns]')
+        elif col == 'weekday':
+            out[col] = df[col].astype('category')
+        elif col == 'attendance':
+            out[col] = df[col].astype(bool)
+        else:
+            out[col] = df[col].astype(field.type.to_pandas_dtype())
+    return out.reset_index(drop=True)
+
+
+def _write(df, schema, root, weeks=None):
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    write_options = dict(
+        format="parquet",
+        partitioning=_PARTITIONING,
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+    )
+
+    # Written into a fresh directory that is swapped in, so readers never see
+    # a half-written store and a failed write leaves the old data in place
+    tmp_root = f"{root}.tmp-{uuid.uuid4().hex}"
+    ds.write_dataset(table, tmp_root, **write_options)
+    old_root = f"{root}.old-{uuid.uuid4().hex}"
+
+    if weeks is not None:
+        # Only the week partitions in the new data are replaced
+        _swap_partitions(tmp_root, root, old_root)
+        return
+
+    if os.path.exists(root):
+        os.rename(root, old_root)
+    os.makedirs(os.path.dirname(root) or ".", exist_ok=True)
+    os.rename(tmp_root, root)
+    shutil.rmtree(old_root, ignore_errors=True)
+
+
+def _swap_partitions(tmp_root, root, old_root):
+    # Moves each week_number=... directory of tmp_root into root; the
+    # replaced ones are put back if any rename fails
+    os.makedirs(root, exist_ok=True)
+    os.makedirs(old_root)
+    swapped = []
+    try:
+        for name in sorted(os.listdir(tmp_root)):
+            target = os.path.join(root, name)
+            if os.path.exists(target):
+                os.rename(target, os.path.join(old_root, name))
+            os.rename(os.path.join(tmp_root, name), target)
+            swapped.append(name)
+    except Exception:
+        for name in swapped:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        for name in os.listdir(old_root):
+            os.rename(os.path.join(old_root, name), os.path.join(root, name))
+        raise
+    finally:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+        shutil.rmtree(old_root, ignore_errors=True)
+
+
+def _read(root, schema, columns=None, weeks=None):
+    dataset = ds.dataset(root, schema=schema, format="parquet", partitioning=_PARTITIONING)
+    filter_expr = ds.field("week_number").isin([int(week) for week in weeks]) if weeks is not None else None
+    read_columns = columns if columns is None or 'row_id' in columns else ['row_id'] + list(columns)
+    table = dataset.to_table(columns=read_columns, filter=filter_expr)
+    df = table.to_pandas().sort_values('row_id', kind='stable', ignore_index=True)
+    return df if read_columns is columns else df.drop(columns='row_id')
+
+
+def next_row_id():
+    # First free row_id after the rows already in the raw store
+    if not raw_store_exists():
+        return 0
+    row_ids = ds.dataset(RAW_STORE, schema=RAW_SCHEMA, format="parquet",
+                         partitioning=_PARTITIONING).to_table(columns=['row_id'])['row_id']
+    return int(pc.max(row_ids).as_py()) + 1 if len(row_ids) else 0
+
+
+def write_raw_attendance(df, weeks=None):
+    _write(to_raw_schema(df), RAW_SCHEMA, RAW_STORE, weeks=weeks)
+
+
+def write_processed_attendance(df):
+    _write(to_processed_schema(df), PROCESSED_SCHEMA, PROCESSED_STORE)
+
+
+def raw_store_exists():
+    return os.path.isdir(RAW_STORE)
+
+
+def processed_store_exists():
+    return os.path.isdir(PROCESSED_STORE)
+
+
+def read_raw_attendance(columns=None, weeks=None):
+    if not raw_store_exists():
+        if not os.path.exists(RAW_CSV):
+            return None
+        write_raw_attendance(pd.read_csv(RAW_CSV))
+    return _read(RAW_STORE, RAW_SCHEMA, columns=columns, weeks=weeks)
+
+
+def read_processed_attendance(columns=None):
+    if not processed_store_exists():
+        if not os.path.exists(PROCESSED_CSV):
+            return None
+        write_processed_attendance(pd.read_csv(PROCESSED_CSV, na_values=['NaN', '?', '']))
+    return _read(PROCESSED_STORE, PROCESSED_SCHEMA, columns=columns)
+
+
+if __name__ == "__main__":
+    # Converts the legacy CSV datasets into the columnar store
+    for name, csv_path, write in [
+        ("raw", RAW_CSV, write_raw_attendance),
+        ("processed", PROCESSED_CSV, write_processed_attendance),
+    ]:
+        if os.path.exists(csv_path):
+            write(pd.read_csv(csv_path, na_values=['NaN', '?', '']))
+            print(f"Converted {csv_path} to the {name} attendance store")
@@ -1,23 +1,21 @@
 import pandas as pd
-from db.connection import get_db_engine
-import json
-from db.utils.flask_security import call_flask_decrypt_api
+from db.connection import read_sql_async
+from db.utils.flask_security import decrypt_json_values
 from datetime import datetime
+import asyncio
+import logging
+import os
+import threading
+import time
 
-def convert_to_am_pm(time_str):
-    try:
-        # Assuming the input time format is "HH:MM:SS"
-        time_obj = datetime.strptime(time_str, '%H:%M:%S')
-        return time_obj.strftime('%I:%M:%S %p')  # Convert to 12-hour format with AM/PM
-    except Exception as e:
-        print(f"Error converting time: {e}")
-        return time_str  # In case of error, return the original time string
+# The latest-week timetable is the same for every student, so it is built once
+# and shared. It is reloaded when the max week_number in the view changes
+# (probed at most every TIMETABLE_PROBE_INTERVAL seconds) or when the TTL expires.
+TIMETABLE_CACHE_TTL = int(os.getenv("TIMETABLE_CACHE_TTL", "3600"))
+TIMETABLE_PROBE_INTERVAL = int(os.getenv("TIMETABLE_PROBE_INTERVAL", "60"))
 
-# Function to fetch and format the latest timetable
-async def fetch_latest_timetable(prn):
-    # Define your SQL query to fetch the timetable for the latest week
-    query = """
-    SELECT 
+LATEST_TIMETABLE_QUERY = """
+    SELECT
         [time_table_id],
         [subject_id],
         [subject_name],
@@ -29,26 +27,30 @@ async def fetch_latest_timetable(prn):
     FROM [psat_final].[dbo].[vw_latest_timetable]
     WHERE [week_number] = (SELECT MAX([week_number]) FROM [psat_final].[dbo].[vw_latest_timetable])
     """
-    
-    # Fetch the data into a pandas DataFrame using your DB engine
-    engine = get_db_engine()  # Assuming this function sets up the engine correctly
-    df = pd.read_sql(query, engine)
-    
-    # Decrypt teacher names
-    decrypted_teacher_names = []
-    for index, row in df.iterrows():
-        encrypted_data = row['teacher_fullname']
-        encrypted_data_json = json.loads(encrypted_data)  # Assuming the data is in JSON format
-        final_data = encrypted_data_json['final_data']
-        encrypted_aes_key = encrypted_data_json['encrypted_aes_key']
-        
-        # Decrypt the teacher name
-        decrypted_name = await call_flask_decrypt_api(final_data, encrypted_aes_key)
-        decrypted_teacher_names.append(decrypted_name)
-    
+
+LATEST_WEEK_QUERY = """
+    SELECT MAX([week_number]) AS [week_number] FROM [psat_final].[dbo].[vw_latest_timetable]
+    """
+
+_cache_lock = threading.Lock()
+_cache = {"week_number": None, "timetable": None, "loaded_at": 0.0, "probed_at": 0.0}
+_cache_stats = {"hits": 0, "misses": 0, "probes": 0, "probe_errors": 0, "reloads": 0}
+_inflight = {}
+
+logger = logging.getLogger(__name__)
+
+def convert_to_am_pm(time_str):
+    try:
+        # Assuming the input time format is "HH:MM:SS"
+        time_obj = datetime.strptime(time_str, '%H:%M:%S')
+        return time_obj.strftime('%I:%M:%S %p')  # Convert to 12-hour format with AM/PM
+    except Exception as e:
+        print(f"Error converting time: {e}")
+        return time_str  # In case of error, return the original time string
+
+def _build_week_timetable(df, decrypted_teacher_names):
     days = df['day_name'].unique()
     timetable_data = {
-        "prn": [prn] * len(days),
         "subject": [],
         "teacher": [],
         "day_name": [],
@@ -56,25 +58,25 @@ async def fetch_latest_timetable(prn):
         "lecture_timing": [],
         "week_number": []
     }
-    
+
     for day in days:
         day_data = df[df['day_name'] == day]  # Filter data for each day
-        
+
         # Sort by lecture_timing and select the earliest
         day_data_sorted = day_data.sort_values(by="lecture_timing", ascending=True)
-        
+
         # Select the earliest lecture for the day (first row after sorting)
         earliest_lecture = day_data_sorted.iloc[0]
-        
+
         # Collect all subjects, teachers, lecture types, and timings
         subjects = day_data_sorted['subject_name'].tolist()
         teachers = [decrypted_teacher_names[i] for i in day_data_sorted.index]
         lecture_types = day_data_sorted['lecture_type'].tolist()
         lecture_timings = day_data_sorted['lecture_timing'].astype(str).tolist()  # Convert time to string
-        
+
         # Convert lecture timings to AM/PM format, but keep all timings
         lecture_timings = [convert_to_am_pm(time) for time in lecture_timings]
-        
+
         # Keep the earliest time only and put it in the structure
         timetable_data["subject"].append(subjects)  # Keep all subjects for the day
         timetable_data["teacher"].append(teachers)  # Keep all teachers for the day
@@ -82,5 +84,81 @@ async def fetch_latest_timetable(prn):
         timetable_data["lecture_type"].append(lecture_types)  # Keep all lecture types for the day
         timetable_data["lecture_timing"].append([lecture_timings[0]])  # Only keep the earliest time for the day
         timetable_data["week_number"].append(int(earliest_lecture['week_number']))  # Keep the week number
-    
+
+    return timetable_data
+
+async def _load_latest_timetable():
+    df = (await read_sql_async(LATEST_TIMETABLE_QUERY)).reset_index(drop=True)
+
+    # Decrypt teacher names (one pooled request per distinct name)
+    decrypted_teacher_names = await decrypt_json_values(df['teacher_fullname'])
+
+    timetable = _build_week_timetable(df, decrypted_teacher_names)
+    week_number = int(df['week_number'].max()) if not df.empty else None
+
+    now = time.monotonic()
+    with _cache_lock:
+        _cache.update(week_number=week_number, timetable=timetable, loaded_at=now, probed_at=now)
+        _cache_stats["reloads"] += 1
+    return timetable
+
+async def _probe_latest_week():
+    df = await read_sql_async(LATEST_WEEK_QUERY)
+    week_number = df['week_number'].iloc[0] if not df.empty else None
+    return int(week_number) if pd.notna(week_number) else None
+
+async def _reload_coalesced():
+    # Concurrent cold misses on the same event loop share one DB fetch
+    loop = asyncio.get_running_loop()
+    task = _inflight.get(loop)
+    if task is None:
+        task = loop.create_task(_load_latest_timetable())
+        _inflight[loop] = task
+        task.add_done_callback(lambda _: _inflight.pop(loop, None))
+    return await asyncio.shield(task)
+
+async def get_latest_timetable():
+    now = time.monotonic()
+    with _cache_lock:
+        timetable = _cache["timetable"]
+        cached_week = _cache["week_number"]
+        fresh = timetable is not None and now - _cache["loaded_at"] < TIMETABLE_CACHE_TTL
+        probe_due = now - _cache["probed_at"] >= TIMETABLE_PROBE_INTERVAL
+        if fresh and probe_due:
+            # Claim the probe so concurrent requests keep serving the cache
+            _cache["probed_at"] = now
+
+    if fresh and probe_due:
+        with _cache_lock:
+            _cache_stats["probes"] += 1
+        try:
+            fresh = await _probe_latest_week() == cached_week
+        except Exception as e:
+            # The cached timetable is still within its TTL, keep serving it
+            logger.warning(f"Latest-week probe failed, serving the cached timetable: {e}")
+            with _cache_lock:
+                _cache_stats["probe_errors"] += 1
+
+    with _cache_lock:
+        _cache_stats["hits" if fresh else "misses"] += 1
+
+    if fresh:
+        return timetable
+    return await _reload_coalesced()
+
+def invalidate_timetable_cache():
+    with _cache_lock:
+        _cache.update(week_number=None, timetable=None, loaded_at=0.0, probed_at=0.0)
+
+def get_timetable_cache_stats():
+    with _cache_lock:
+        return dict(_cache_stats, week_number=_cache["week_number"])
+
+# Function to fetch and format the latest timetable
+async def fetch_latest_timetable(prn):
+    timetable = await get_latest_timetable()
+
+    # Same structure as before, with the PRN filled in for the caller
+    timetable_data = {"prn": [prn] * len(timetable["day_name"])}
+    timetable_data.update(timetable)
     return timetable_data
@@ -1,8 +1,16 @@
 import pymssql
+import pandas as pd
 from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
 from dotenv import load_dotenv
 import os
 import logging
+import threading
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from services import metrics
 
 # Load environment variables
 load_dotenv()
@@ -17,6 +25,42 @@ DB_DATABASE = os.getenv("DB_DATABASE")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_PORT = os.getenv("DB_PORT", "1433")
+# Full SQLAlchemy URL overriding the SQL Server settings above, e.g. a local
+# stand-in database for benchmarks
+DB_URL = os.getenv("DB_URL")
+
+# Connection pool configuration
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# Blocking pymssql work runs on a bounded executor so the event loop stays free
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(DB_POOL_SIZE)))
+DB_QUERY_TIMEOUT = int(os.getenv("DB_QUERY_TIMEOUT", "60"))
+
+_engine = None
+_engine_lock = threading.Lock()
+_executor = None
+
+_pool_wait_lock = threading.Lock()
+_pool_wait = {"checkouts": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+
+
+class TimedQueuePool(QueuePool):
+    # Records how long callers wait to get a connection out of the pool
+    # (including the login when the pool has to open a new one).
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            with _pool_wait_lock:
+                _pool_wait["checkouts"] += 1
+                _pool_wait["total_seconds"] += waited
+                _pool_wait["max_seconds"] = max(_pool_wait["max_seconds"], waited)
 
 def get_db_connection():
     try:
@@ -40,17 +84,98 @@ def get_db_connection():
         logger.error("Unexpected error connecting to the database: %s", e)
         raise
 
-def get_db_engine():
+def _create_engine():
     try:
+        url = DB_URL or f"mssql+pymssql://{DB_USER}:{DB_PASSWORD}@{DB_SERVER}:{DB_PORT}/{DB_DATABASE}"
+        # pymssql enforces the query timeout on the server connection as well
+        connect_args = {"login_timeout": 10, "timeout": DB_QUERY_TIMEOUT} if url.startswith("mssql+pymssql") else {}
         engine = create_engine(
-            f"mssql+pymssql://{DB_USER}:{DB_PASSWORD}@{DB_SERVER}:{DB_PORT}/{DB_DATABASE}",
-            pool_size=20,         
-            max_overflow=10,      
-            pool_timeout=30,      
-            pool_recycle=1800, 
+            url,
+            connect_args=connect_args,
+            poolclass=TimedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
         )
         logger.info("SQLAlchemy Engine created successfully with connection pooling!")
         return engine
     except Exception as e:
         logger.error("Error creating SQLAlchemy engine: %s", e)
         raise
+
+def get_db_engine():
+    # One engine (and connection pool) per process, shared by the Quart app
+    # and the scheduler thread
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = _create_engine()
+    return _engine
+
+def _get_db_executor():
+    global _executor
+    if _executor is None:
+        with _engine_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+    return _executor
+
+async def read_sql_async(query, params=None, timeout=None):
+    # pd.read_sql on the DB executor; at most DB_EXECUTOR_WORKERS queries run
+    # at once and the caller gives up after `timeout` seconds
+    timeout = timeout or DB_QUERY_TIMEOUT
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(
+        _get_db_executor(),
+        functools.partial(pd.read_sql, query, get_db_engine(), params=params)
+    )
+    status = "error"
+    try:
+        with metrics.stage("db"):
+            df = await asyncio.wait_for(future, timeout)
+        status = "ok"
+        return df
+    except asyncio.TimeoutError:
+        status = "timeout"
+        logger.error("Database query timed out after %s seconds", timeout)
+        raise TimeoutError(f"Database query timed out after {timeout} seconds")
+    finally:
+        metrics.count("db_queries_total", status=status)
+
+def dispose_db_engine():
+    global _engine, _executor
+    with _engine_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+            logger.info("SQLAlchemy Engine disposed.")
+
+def get_pool_stats():
+    with _pool_wait_lock:
+        wait = dict(_pool_wait)
+
+    stats = {
+        "engine_created": _engine is not None,
+        "checkouts": wait["checkouts"],
+        "wait_time_total_seconds": round(wait["total_seconds"], 6),
+        "wait_time_max_seconds": round(wait["max_seconds"], 6),
+        "wait_time_avg_seconds": round(wait["total_seconds"] / wait["checkouts"], 6) if wait["checkouts"] else 0.0,
+    }
+
+    engine = _engine
+    if engine is not None:
+        pool = engine.pool
+        stats.update({
+            "pool_size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(0, pool.overflow()),
+            "max_overflow": DB_MAX_OVERFLOW,
+        })
+    return stats
@@ -1,24 +1,8 @@
-import pickle
 import pandas as pd
-import os
-import asyncio
-from db.connection import get_db_engine  
-from db.utils.flask_security import call_flask_decrypt_api
-import json
+from db.connection import read_sql_async
+from db.utils.flask_security import decrypt_json_values
 
-MODEL_FOLDER = os.path.join('models/marks')
-
-# Load models and scaler for different semesters
-with open(os.path.join(MODEL_FOLDER, 'linear_model.pkl'), 'rb') as f:
-    loaded_model = pickle.load(f)
-
-with open(os.path.join(MODEL_FOLDER, 'scaler.pkl'), 'rb') as f:
-    scaler = pickle.load(f)
-
-async def fetch_student_data(prn):
-    engine = get_db_engine()
-    
-    query = """
+STUDENT_SUMMARY_QUERY = """
         SELECT prn,
             student_full_name,
             current_sem,
@@ -41,31 +25,60 @@ async def fetch_student_data(prn):
             sem_6_marks_total,
             sem_6_obtainable_total
         FROM psat_final.dbo.student_academic_summary
-        WHERE prn = %s
-    """
+"""
 
-    df = await asyncio.to_thread(pd.read_sql, query, engine, params=(prn,))
-    
-    if 'student_full_name' in df.columns and not df.empty:
-        encrypted_info = df['student_full_name'].iloc[0]
-        
-        decrypted_data = json.loads(encrypted_info)
-        
-        encrypted_data = decrypted_data['final_data']
-        encrypted_aes_key = decrypted_data['encrypted_aes_key']
-        
-        decrypted_name = await call_flask_decrypt_api(encrypted_data, encrypted_aes_key)
-        
-        df['student_full_name'] = decrypted_name
-    
+# SQL Server accepts at most 2100 parameters per statement
+PRN_CHUNK_SIZE = 1000
+
+
+async def _decrypt_student_names(df):
+    encrypted_names = df['student_full_name'].dropna().unique().tolist()
+    decrypted_names = dict(zip(encrypted_names, await decrypt_json_values(encrypted_names)))
+
+    df['student_full_name'] = df['student_full_name'].map(decrypted_names)
+    return df
+
+
+def _add_marks_percentages(df):
     for sem in range(1, 7):
         marks_col = f'sem_{sem}_marks_total'
         obtainable_col = f'sem_{sem}_obtainable_total'
         perc_col = f'sem_{sem}_marks_percentage'
-        
+
         if marks_col in df.columns and obtainable_col in df.columns:
             df[perc_col] = (df[marks_col] / df[obtainable_col]) * 100
 
     return df
 
 
+async def fetch_student_data(prn):
+    query = STUDENT_SUMMARY_QUERY + " WHERE prn = %s"
+
+    df = await read_sql_async(query, params=(prn,))
+    
+    if 'student_full_name' in df.columns and not df.empty:
+        df = await _decrypt_student_names(df)
+
+    return _add_marks_percentages(df)
+
+
+async def fetch_students_data(prns):
+    prns = list(dict.fromkeys(prns))
+
+    # One IN (...) query per chunk instead of one query per student
+    frames = []
+    for start in range(0, len(prns), PRN_CHUNK_SIZE):
+        chunk = prns[start:start + PRN_CHUNK_SIZE]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        query = STUDENT_SUMMARY_QUERY + f" WHERE prn IN ({placeholders})"
+        frames.append(await read_sql_async(query, params=tuple(chunk)))
+
+    if not frames:
+        return pd.DataFrame()
+
+    df = pd.concat(frames, ignore_index=True)
+
+    if 'student_full_name' in df.columns and not df.empty:
+        df = await _decrypt_student_names(df)
+
+    return _add_marks_percentages(df)
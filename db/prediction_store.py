@@ -0,0 +1,105 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+# Precomputed predictions for every student, keyed by (kind, prn), in a local
+# SQLite file. A scoring run writes a complete new file and renames it over
+# the old one, so readers always see one whole run. Each kind ("attendance",
+# "marks") records the versions it was computed with; the server only serves
+# a row while those still match what a live prediction would use.
+
+PREDICTION_STORE_FILE = os.getenv("PREDICTION_STORE_FILE", os.path.join("data", "predictions", "predictions.sqlite"))
+
+SCHEMA = [
+    """CREATE TABLE predictions (
+        kind TEXT NOT NULL,
+        prn TEXT NOT NULL,
+        body TEXT NOT NULL,
+        PRIMARY KEY (kind, prn)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE runs (
+        kind TEXT PRIMARY KEY,
+        versions TEXT NOT NULL,
+        rows INTEGER NOT NULL,
+        created_at TEXT NOT NULL
+    )""",
+]
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stale": 0}
+
+
+def write_prediction_store(results, versions, path=None):
+    # results: {kind: {prn: body}}, versions: {kind: {...}}
+    path = path or PREDICTION_STORE_FILE
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    created_at = datetime.now().isoformat(timespec='seconds')
+    conn = sqlite3.connect(tmp_path)
+    try:
+        for ddl in SCHEMA:
+            conn.execute(ddl)
+        for kind, bodies in results.items():
+            conn.executemany(
+                "INSERT INTO predictions (kind, prn, body) VALUES (?, ?, ?)",
+                ((kind, str(prn), json.dumps(body)) for prn, body in bodies.items()),
+            )
+            conn.execute(
+                "INSERT INTO runs (kind, versions, rows, created_at) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(versions.get(kind, {}), sort_keys=True), len(bodies), created_at),
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+
+
+def _connection(path):
+    # One read-only connection per thread, reopened after a new run is swapped in
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None, None
+    signature = (path, stat.st_ino, stat.st_mtime_ns)
+    cached = getattr(_local, "store", None)
+    if cached is None or cached[0] != signature:
+        if cached is not None:
+            cached[1].close()
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        runs = {
+            kind: {"versions": json.loads(versions), "rows": rows, "created_at": created_at}
+            for kind, versions, rows, created_at in conn.execute("SELECT kind, versions, rows, created_at FROM runs")
+        }
+        _local.store = cached = (signature, conn, runs)
+    return cached[1], cached[2]
+
+
+def get_stored_prediction(kind, prn, versions, path=None):
+    # The stored body, or None when missing or computed with other versions
+    conn, runs = _connection(path or PREDICTION_STORE_FILE)
+    run = runs.get(kind) if runs is not None else None
+    if run is None or run["versions"] != versions:
+        with _stats_lock:
+            _stats["stale" if run is not None else "misses"] += 1
+        return None
+
+    row = conn.execute("SELECT body FROM predictions WHERE kind = ? AND prn = ?", (kind, str(prn))).fetchone()
+    with _stats_lock:
+        _stats["hits" if row is not None else "misses"] += 1
+    return json.loads(row[0]) if row is not None else None
+
+
+def get_prediction_store_stats(path=None):
+    try:
+        _, runs = _connection(path or PREDICTION_STORE_FILE)
+    except sqlite3.Error:
+        runs = None
+    with _stats_lock:
+        return dict(_stats, runs=runs or {})
+
@@ -1,11 +1,188 @@
 import aiohttp
 import os
 import asyncio
+import json
+import hashlib
+import weakref
 from dotenv import load_dotenv
+from db.utils.cache import TTLCache
+from services import metrics
 
 load_dotenv()
 FLASK_API_URL = os.getenv("REACT_APP_FLASK_API_URL")
 
+# Decrypt client configuration
+DECRYPT_MAX_CONNECTIONS = int(os.getenv("DECRYPT_MAX_CONNECTIONS", "20"))
+DECRYPT_CONCURRENCY = int(os.getenv("DECRYPT_CONCURRENCY", "10"))
+DECRYPT_TIMEOUT = float(os.getenv("DECRYPT_TIMEOUT", "10"))
+# Optional bulk endpoint on the Flask service, e.g. "decrypt-bulk". It takes
+# {"items": [{"encrypted_data", "encrypted_aes_key"}, ...]} and answers
+# {"decrypted_data": [...]} in the same order. Empty means one call per value.
+DECRYPT_BULK_ENDPOINT = os.getenv("DECRYPT_BULK_ENDPOINT", "").strip("/")
+DECRYPT_BULK_SIZE = int(os.getenv("DECRYPT_BULK_SIZE", "100"))
+
+# Decrypted values rarely change (teacher rosters a few times a semester), so
+# they are cached in-process, keyed by a hash of the ciphertext.
+DECRYPT_CACHE_SIZE = int(os.getenv("DECRYPT_CACHE_SIZE", "10000"))
+DECRYPT_CACHE_TTL = int(os.getenv("DECRYPT_CACHE_TTL", "86400"))
+
+decrypted_value_cache = TTLCache(maxsize=DECRYPT_CACHE_SIZE, ttl=DECRYPT_CACHE_TTL)
+
+
+def _cache_key(encrypted_data, encrypted_aes_key):
+    digest = hashlib.sha256()
+    digest.update(encrypted_data.encode())
+    digest.update(b"\0")
+    digest.update(encrypted_aes_key.encode())
+    return digest.hexdigest()
+
+
+class DecryptClient:
+    def __init__(self, base_url=None, max_connections=DECRYPT_MAX_CONNECTIONS,
+                 concurrency=DECRYPT_CONCURRENCY, bulk_endpoint=DECRYPT_BULK_ENDPOINT,
+                 bulk_size=DECRYPT_BULK_SIZE, timeout=DECRYPT_TIMEOUT):
+        self.base_url = base_url or FLASK_API_URL
+        self.max_connections = max_connections
+        self.bulk_endpoint = bulk_endpoint
+        self.bulk_size = bulk_size
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session = None
+
+    def _get_session(self):
+        # One keep-alive session per client so TCP/TLS connections are reused
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={'Content-Type': 'application/json'}
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def decrypt(self, encrypted_data, encrypted_aes_key):
+        key = _cache_key(encrypted_data, encrypted_aes_key)
+        cached = decrypted_value_cache.get(key)
+        if cached is not None:
+            return cached
+
+        with metrics.stage("decrypt"):
+            decrypted = await self._decrypt_remote(encrypted_data, encrypted_aes_key)
+        decrypted_value_cache.set(key, decrypted)
+        return decrypted
+
+    async def _decrypt_remote(self, encrypted_data, encrypted_aes_key):
+        decrypt_data = {
+            "encrypted_data": encrypted_data,
+            "encrypted_aes_key": encrypted_aes_key
+        }
+        async with self._semaphore:
+            metrics.count("decrypt_requests_total", mode="single")
+            try:
+                async with self._get_session().post(f"{self.base_url}/decrypt", json=decrypt_data) as response:
+                    response.raise_for_status()
+                    return (await response.json()).get("decrypted_data")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                print("Failed to call Flask decrypt:", error)
+                raise Exception("Failed to decrypt data")
+
+    async def _decrypt_bulk(self, items):
+        payload = {"items": [
+            {"encrypted_data": encrypted_data, "encrypted_aes_key": encrypted_aes_key}
+            for encrypted_data, encrypted_aes_key in items
+        ]}
+        async with self._semaphore:
+            metrics.count("decrypt_requests_total", mode="bulk")
+            async with self._get_session().post(f"{self.base_url}/{self.bulk_endpoint}", json=payload) as response:
+                if response.status == 404:
+                    return None
+                response.raise_for_status()
+                decrypted = (await response.json()).get("decrypted_data")
+
+        if not isinstance(decrypted, list) or len(decrypted) != len(items):
+            raise Exception("Failed to decrypt data")
+        return decrypted
+
+    async def _decrypt_unique(self, items):
+        if self.bulk_endpoint:
+            try:
+                chunks = [items[i:i + self.bulk_size] for i in range(0, len(items), self.bulk_size)]
+                results = await asyncio.gather(*(self._decrypt_bulk(chunk) for chunk in chunks))
+                if all(result is not None for result in results):
+                    return [value for result in results for value in result]
+                # The service doesn't know the bulk endpoint; stop trying it
+                print("Flask bulk decrypt endpoint not found, falling back to single calls")
+                self.bulk_endpoint = ""
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                print("Failed to call Flask bulk decrypt:", error)
+                raise Exception("Failed to decrypt data")
+
+        # Bounded fan-out, the semaphore caps concurrent requests
+        return await asyncio.gather(*(self._decrypt_remote(*item) for item in items))
+
+    async def decrypt_many(self, items):
+        # items: iterable of (encrypted_data, encrypted_aes_key); identical or
+        # cached ciphertexts are only sent once. Results keep the input order.
+        items = list(items)
+        unique_items = list(dict.fromkeys(items))
+        if not unique_items:
+            return []
+
+        decrypted = {}
+        missing = []
+        for item in unique_items:
+            cached = decrypted_value_cache.get(_cache_key(*item))
+            if cached is None:
+                missing.append(item)
+            else:
+                decrypted[item] = cached
+
+        if missing:
+            with metrics.stage("decrypt"):
+                values = await self._decrypt_unique(missing)
+            for item, value in zip(missing, values):
+                decrypted_value_cache.set(_cache_key(*item), value)
+                decrypted[item] = value
+
+        return [decrypted[item] for item in items]
+
+
+# aiohttp sessions are bound to an event loop, and the scheduler runs its jobs
+# in their own loop, so each loop gets its own client.
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_decrypt_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = DecryptClient()
+        _clients[loop] = client
+    return client
+
+
+async def close_decrypt_client():
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+def parse_encrypted_value(encrypted_value):
+    encrypted_data_json = json.loads(encrypted_value)
+    return encrypted_data_json['final_data'], encrypted_data_json['encrypted_aes_key']
+
+
+async def decrypt_json_values(encrypted_values):
+    # Decrypts a list of {"final_data", "encrypted_aes_key"} JSON blobs
+    items = [parse_encrypted_value(value) for value in encrypted_values]
+    return await get_decrypt_client().decrypt_many(items)
+
+
 async def call_flask_encrypt_api(endpoint, data):
     try:
         async with aiohttp.ClientSession() as session:
@@ -21,20 +198,4 @@ async def call_flask_encrypt_api(endpoint, data):
         raise Exception("Failed to call Flask API")
 
 async def call_flask_decrypt_api(encrypted_data, encrypted_aes_key):
-    try:
-        decrypt_data = {
-            "encrypted_data": encrypted_data,
-            "encrypted_aes_key": encrypted_aes_key
-        }
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{FLASK_API_URL}/decrypt",
-                json=decrypt_data,
-                headers={'Content-Type': 'application/json'}
-            ) as response:
-                response.raise_for_status()
-                return (await response.json()).get("decrypted_data")
-    except aiohttp.ClientError as error:
-        print("Failed to call Flask decrypt:", error)
-        raise Exception("Failed to decrypt data")
-
+    return await get_decrypt_client().decrypt(encrypted_data, encrypted_aes_key)
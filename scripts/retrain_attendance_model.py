@@ -1,70 +1,132 @@
-import pandas as pd
 import pickle
+import json
 import os
+import time
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.ensemble import VotingClassifier
 from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.model_selection import train_test_split, GridSearchCV
+from sklearn.model_selection import train_test_split, GridSearchCV, StratifiedKFold
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import HalvingGridSearchCV
+from sklearn.utils import Bunch
 from sklearn.metrics import accuracy_score
+from db.attendance_store import read_raw_attendance, write_processed_attendance
+from services.attendance_features import add_trend_features
+from services.model_registry import write_manifest
+from services.encoder_registry import save_encoder_tables, tables_from_label_encoders
+from services.native_scorer import check_parity, compile_native_scorer, save_native_scorer
 
-DATA_FILE = os.path.join("data/attendance", "attendance_dataset.csv")
 MODEL_FILE = os.path.join("models/attendance", "voting_model.pkl")
 SCALER_FILE = os.path.join("models/attendance", "scaler.pkl")
+NATIVE_SCORER_FILE = os.path.join("models/attendance", "native_scorer.npz")
+ENCODER_TABLES_FILE = os.path.join("models/attendance", "encoders.json")
 ENCODERS_PATH = os.path.join("models","attendance")
-PROCESSED_DATA_PATH = os.path.join("data/attendance", "processed")
+BEST_PARAMS_FILE = os.path.join("models", "attendance", "best_params.json")
+
+# Parallel jobs for the grid searches (the pipeline worker lowers this)
+TRAIN_N_JOBS = int(os.getenv("TRAIN_N_JOBS", "-1"))
+# "grid" (exhaustive) or "halving" (successive halving, for large datasets)
+TRAIN_SEARCH = os.getenv("TRAIN_SEARCH", "grid")
+# Reuse the last searched hyperparameters until the dataset has grown by
+# more than TRAIN_RESEARCH_GROWTH (0.25 = 25%) since that search
+TRAIN_WARM_START = os.getenv("TRAIN_WARM_START", "1") == "1"
+TRAIN_RESEARCH_GROWTH = float(os.getenv("TRAIN_RESEARCH_GROWTH", "0.25"))
+CV_FOLDS = 5
+
+PARAM_GRID_DT = {
+    'max_depth': [5, 10, 20],
+    'min_samples_split': [2, 5, 10],
+    'min_samples_leaf': [1, 2, 5]
+}
+PARAM_GRID_LOG = {
+    'C': [0.1, 1, 10],
+    'solver': ['liblinear', 'saga']
+}
+
+
+class StageTimer:
+    # Wall time of each training stage, measured since the previous lap
+    def __init__(self):
+        self.started = self.last = time.perf_counter()
+        self.stages = {}
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.stages[name] = round(now - self.last, 3)
+        self.last = now
+
+    def report(self):
+        return {"stages": dict(self.stages), "total_seconds": round(time.perf_counter() - self.started, 3)}
+
+def save_pickle(obj, path):
+    # Written next to the target and renamed, so a reload never reads a partial file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(obj, f)
+    os.replace(tmp_path, path)
+
+def read_best_params():
+    if not os.path.exists(BEST_PARAMS_FILE):
+        return None
+    with open(BEST_PARAMS_FILE) as f:
+        return json.load(f)
+
+
+def save_best_params(dt_params, log_reg_params, rows):
+    tmp_path = BEST_PARAMS_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"dt": dt_params, "log_reg": log_reg_params, "rows": rows, "search": TRAIN_SEARCH}, f, indent=2)
+    os.replace(tmp_path, BEST_PARAMS_FILE)
+
+
+def reuse_best_params(previous, rows):
+    if not TRAIN_WARM_START or previous is None or not previous.get("rows"):
+        return False
+    return rows <= previous["rows"] * (1 + TRAIN_RESEARCH_GROWTH)
+
+
+def tune(estimator, param_grid, params, X, y, cv_splits):
+    # Fits `params` directly when given, otherwise searches param_grid
+    if params is not None:
+        return estimator.set_params(**params).fit(X, y), params
+    if TRAIN_SEARCH == "grid":
+        search = GridSearchCV(estimator, param_grid, cv=cv_splits, n_jobs=TRAIN_N_JOBS, scoring='accuracy')
+    else:
+        # Candidates are scored on growing subsamples of the same folds and
+        # only the best third moves on to the next round
+        search = HalvingGridSearchCV(estimator, param_grid, cv=cv_splits, factor=3, n_jobs=TRAIN_N_JOBS,
+                                     scoring='accuracy', random_state=42)
+    search.fit(X, y)
+    return search.best_estimator_, search.best_params_
+
+
+def voting_from_fitted(estimators, label_encoder):
+    # The estimators are already fitted on label_encoder's codes, which is
+    # what VotingClassifier.fit would refit clones of
+    voting_clf = VotingClassifier(estimators=estimators, voting='soft')
+    voting_clf.le_ = label_encoder
+    voting_clf.classes_ = label_encoder.classes_
+    voting_clf.estimators_ = [est for _, est in estimators]
+    voting_clf.named_estimators_ = Bunch(**dict(estimators))
+    return voting_clf
 
-os.makedirs(PROCESSED_DATA_PATH, exist_ok=True)
 
 async def train_and_save_model():
     print("Retraining model...")
-    retrieved_data = pd.read_csv(DATA_FILE)
-    dataset = pd.DataFrame(retrieved_data)
+    timer = StageTimer()
+    # Typed columns from the store: dates are already parsed and lecture
+    # timings are stored as time_in_minutes
+    dataset = read_raw_attendance()
+    timer.lap("load")
     numerical_cols = dataset.select_dtypes(include=['float64', 'int64']).columns
     dataset[numerical_cols] = dataset[numerical_cols].fillna(dataset[numerical_cols].mean())
 
-    categorical_cols = dataset.select_dtypes(include=['object']).columns
+    categorical_cols = dataset.select_dtypes(include=['object', 'category']).columns
     for col in categorical_cols:
         dataset[col] = dataset[col].fillna(dataset[col].mode()[0])
 
-    dataset['date'] = pd.to_datetime(dataset['date'])
-    dataset['weekday'] = dataset['date'].dt.day_name()
-    dataset['attendance_percentage'] = dataset['attendance'] * 100
-
-    weekly_attendance = dataset.groupby(['prn', 'subject', 'week_number'])['attendance_percentage'].mean().reset_index()
-    weekly_attendance.rename(columns={'attendance_percentage': 'attendance_percentage_weekly'}, inplace=True)
-
-    daywise_attendance = dataset.groupby(['prn', 'weekday'])['attendance_percentage'].mean().reset_index()
-    daywise_attendance.rename(columns={'attendance_percentage': 'attendance_percentage_daily'}, inplace=True)
-
-    lecture_type_attendance = dataset.groupby(['prn', 'lecture_type'])['attendance_percentage'].mean().reset_index()
-    lecture_type_attendance.rename(columns={'attendance_percentage': 'lecture_type_attendance_percentage'}, inplace=True)
-
-    lecture_timing_attendance = dataset.groupby(['prn', 'lecture_timing'])['attendance_percentage'].mean().reset_index()
-    lecture_timing_attendance.rename(columns={'attendance_percentage': 'lecture_timing_attendance_percentage'}, inplace=True)
-
-    if 'attendance_percentage_weekly' in dataset.columns:
-        dataset.drop(columns=['attendance_percentage_weekly'], inplace=True)
-    dataset = dataset.merge(weekly_attendance, on=['prn', 'subject', 'week_number'], how='left')
-
-    if 'attendance_percentage_daily' in dataset.columns:
-        dataset.drop(columns=['attendance_percentage_daily'], inplace=True)
-    dataset = dataset.merge(daywise_attendance, on=['prn', 'weekday'], how='left')
-
-    if 'lecture_type_attendance_percentage' in dataset.columns:
-        dataset.drop(columns=['lecture_type_attendance_percentage'], inplace=True)
-    dataset = dataset.merge(lecture_type_attendance, on=['prn', 'lecture_type'], how='left')
-
-    if 'lecture_timing_attendance_percentage' in dataset.columns:
-        dataset.drop(columns=['lecture_timing_attendance_percentage'], inplace=True)
-    dataset = dataset.merge(lecture_timing_attendance, on=['prn', 'lecture_timing'], how='left')
-
-    teacher_probability = dataset.groupby(['teacher', 'subject'])['attendance_percentage'].mean().reset_index()
-    teacher_probability.rename(columns={'attendance_percentage': 'teacher_probability'}, inplace=True)
-
-    if 'teacher_probability' in dataset.columns:
-        dataset.drop(columns=['teacher_probability'], inplace=True)
-    dataset = dataset.merge(teacher_probability, on=['teacher', 'subject'], how='left')
+    add_trend_features(dataset)
 
     le_subject = LabelEncoder()
     le_teacher = LabelEncoder()
@@ -78,20 +140,6 @@ async def train_and_save_model():
     dataset['lecture_type'] = le_lecture_type.fit_transform(dataset['lecture_type'])
     dataset['festival'] = le_festival.fit_transform(dataset['festival'])
 
-    with open(os.path.join(ENCODERS_PATH, 'le_subject.pkl'), 'wb') as f:
-        pickle.dump(le_subject, f)
-    with open(os.path.join(ENCODERS_PATH, 'le_teacher.pkl'), 'wb') as f:
-        pickle.dump(le_teacher, f)
-    with open(os.path.join(ENCODERS_PATH, 'le_day.pkl'), 'wb') as f:
-        pickle.dump(le_day, f)
-    with open(os.path.join(ENCODERS_PATH, 'le_lecture_type.pkl'), 'wb') as f:
-        pickle.dump(le_lecture_type, f)
-    with open(os.path.join(ENCODERS_PATH, 'le_festival.pkl'), 'wb') as f:
-        pickle.dump(le_festival, f)
-
-    dataset['lecture_timing'] = pd.to_datetime(dataset['lecture_timing'], format='%H:%M')
-    dataset['time_in_minutes'] = dataset['lecture_timing'].dt.hour * 60 + dataset['lecture_timing'].dt.minute
-
     features = ['prn', 'subject', 'teacher', 'day_name', 'lecture_type',
                 'time_in_minutes', 'week_number', 'attendance_percentage_weekly',
                 'attendance_percentage_daily', 'teacher_probability', 
@@ -102,7 +150,7 @@ async def train_and_save_model():
     y = dataset[target]
 
     dataset.dropna(inplace=True)
-    dataset.to_csv(os.path.join(PROCESSED_DATA_PATH, "processed_attendance_dataset.csv"), index=False)
+    timer.lap("features")
 
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
 
@@ -110,61 +158,91 @@ async def train_and_save_model():
     X_train_scaled = scaler.fit_transform(X_train)
     X_test_scaled = scaler.transform(X_test)
 
-    dt_model = DecisionTreeClassifier(criterion='entropy', min_samples_split=5, min_samples_leaf=2, random_state=42)
+    # Estimators are fitted on the label codes VotingClassifier uses
+    # internally, so the tuned models can go into the ensemble as they are
+    label_encoder = LabelEncoder().fit(y_train)
+    y_train_codes = label_encoder.transform(y_train)
+    y_test_codes = label_encoder.transform(y_test)
 
-    param_grid_dt = {
-        'max_depth': [5, 10, 20],
-        'min_samples_split': [2, 5, 10],
-        'min_samples_leaf': [1, 2, 5]
-    }
+    # One set of folds shared by both searches
+    cv_splits = list(StratifiedKFold(n_splits=CV_FOLDS).split(X_train_scaled, y_train_codes))
+    timer.lap("scale")
 
-    grid_search_dt = GridSearchCV(dt_model, param_grid_dt, cv=5, n_jobs=-1, scoring='accuracy')
-    grid_search_dt.fit(X_train_scaled, y_train)
+    previous = read_best_params()
+    reuse = reuse_best_params(previous, len(dataset))
+    if reuse:
+        print(f"Warm start from hyperparameters searched on {previous['rows']} rows")
 
-    best_dt = grid_search_dt.best_estimator_
-    print("Best Decision Tree Parameters:", grid_search_dt.best_params_)
+    dt_model = DecisionTreeClassifier(criterion='entropy', min_samples_split=5, min_samples_leaf=2, random_state=42)
+    best_dt, best_dt_params = tune(dt_model, PARAM_GRID_DT, previous['dt'] if reuse else None,
+                                   X_train_scaled, y_train_codes, cv_splits)
+    timer.lap("tune_dt")
+    print("Best Decision Tree Parameters:", best_dt_params)
 
     y_pred_dt = best_dt.predict(X_test_scaled)
-    accuracy_dt = accuracy_score(y_test, y_pred_dt)
+    accuracy_dt = accuracy_score(y_test_codes, y_pred_dt)
     print(f"Decision Tree Test Accuracy: {accuracy_dt:.4f}")
 
     log_reg = LogisticRegression(penalty='l2', solver='liblinear', random_state=42)
-
-    param_grid_log = {
-        'C': [0.1, 1, 10],
-        'solver': ['liblinear', 'saga'] 
-    }
-
-    grid_search_log = GridSearchCV(log_reg, param_grid_log, cv=5, n_jobs=-1, scoring='accuracy')
-    grid_search_log.fit(X_train_scaled, y_train)
-
-    best_log_reg = grid_search_log.best_estimator_
-    print("Best Logistic Regression Parameters:", grid_search_log.best_params_)
+    best_log_reg, best_log_reg_params = tune(log_reg, PARAM_GRID_LOG, previous['log_reg'] if reuse else None,
+                                             X_train_scaled, y_train_codes, cv_splits)
+    timer.lap("tune_log_reg")
+    print("Best Logistic Regression Parameters:", best_log_reg_params)
 
     y_pred_log = best_log_reg.predict(X_test_scaled)
-    accuracy_log = accuracy_score(y_test, y_pred_log)
+    accuracy_log = accuracy_score(y_test_codes, y_pred_log)
     print(f"Logistic Regression Test Accuracy: {accuracy_log:.4f}")
 
-    voting_clf = VotingClassifier(
-        estimators=[('dt', best_dt), ('log_reg', best_log_reg)],
-        voting='soft'
-    )
+    if not reuse:
+        save_best_params(best_dt_params, best_log_reg_params, len(dataset))
 
-    voting_clf.fit(X_train_scaled, y_train)
+    # Same result as VotingClassifier.fit, without refitting both models
+    voting_clf = voting_from_fitted([('dt', best_dt), ('log_reg', best_log_reg)], label_encoder)
+    timer.lap("ensemble")
 
     y_pred_voting = voting_clf.predict(X_test_scaled)
     accuracy_voting = accuracy_score(y_test, y_pred_voting)
     print(f"Voting Classifier Test Accuracy: {accuracy_voting:.4f}")
 
-    with open(MODEL_FILE, 'wb') as model_file:
-        pickle.dump(voting_clf, model_file)
-
-    with open(SCALER_FILE, 'wb') as scaler_file:
-        pickle.dump(scaler, scaler_file)
-
-    for name, encoder in zip(['le_day', 'le_subject', 'le_teacher', 'le_lecture_type','le_festival'], 
-                         [le_day, le_subject, le_teacher, le_lecture_type, le_festival]):
-        with open(os.path.join(ENCODERS_PATH, f"{name}.pkl"), 'wb') as f:
-            pickle.dump(encoder, f)
+    # NumPy-only scorer used for serving; not exported unless it matches
+    # predict_proba to within 1e-9
+    try:
+        native_scorer = compile_native_scorer(scaler, voting_clf)
+        parity = check_parity(native_scorer, scaler, voting_clf, X.dropna())
+        print(f"Native scorer max difference to predict_proba: {parity:.2e}")
+    except Exception as e:
+        print(f"Native scorer not exported, serving falls back to sklearn: {e}")
+        native_scorer = None
+    timer.lap("native_scorer")
+
+    save_pickle(voting_clf, MODEL_FILE)
+    save_pickle(scaler, SCALER_FILE)
+    if native_scorer is not None:
+        save_native_scorer(native_scorer, NATIVE_SCORER_FILE + ".tmp")
+        os.replace(NATIVE_SCORER_FILE + ".tmp", NATIVE_SCORER_FILE)
+    elif os.path.exists(NATIVE_SCORER_FILE):
+        # The previous model's scorer must not be published with this one
+        os.remove(NATIVE_SCORER_FILE)
+
+    label_encoders = dict(zip(['le_day', 'le_subject', 'le_teacher', 'le_lecture_type','le_festival'], 
+                              [le_day, le_subject, le_teacher, le_lecture_type, le_festival]))
+    for name, encoder in label_encoders.items():
+        save_pickle(encoder, os.path.join(ENCODERS_PATH, f"{name}.pkl"))
+    # Plain JSON label tables, what serving builds its encoder maps from
+    save_encoder_tables(tables_from_label_encoders(label_encoders), ENCODER_TABLES_FILE)
+
+    write_processed_attendance(dataset)
+
+    # Publishing the manifest last makes the new version visible to the server
+    manifest = write_manifest(rows=len(dataset))
+    timer.lap("export")
+    print(f"Published attendance model version {manifest['version']}")
+
+    report = timer.report()
+    report.update(search="warm_start" if reuse else TRAIN_SEARCH, rows=len(dataset), accuracy=round(accuracy_voting, 4))
+    for name, seconds in report["stages"].items():
+        print(f"  {name:<14} {seconds:>8.3f}s")
+    print(f"Training finished in {report['total_seconds']:.3f}s ({report['search']})")
+    return report
 
 
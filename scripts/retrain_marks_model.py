@@ -1,16 +1,20 @@
 import pandas as pd
-import pickle
 import os
+from concurrent.futures import ProcessPoolExecutor
 from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.linear_model import Ridge
 from sklearn.metrics import mean_absolute_error, r2_score
 from sklearn.preprocessing import StandardScaler
 import numpy as np
+from services.marks_bundle import BUNDLE_FILE, bundle_arrays, save_marks_bundle
 
 # File Paths
 DATA_FILE = os.path.join("data/marks", "realistic_student_data.xlsx")
-MODEL_FILE = os.path.join("models/marks", "ridge_model.pkl")
-SCALER_FILE = os.path.join("models/marks", "scaler.pkl")
+# Columnar copy of DATA_FILE, rebuilt whenever the workbook is newer
+DATA_CACHE_FILE = os.path.join("data/marks", "realistic_student_data.parquet")
+
+# Semesters are trained in parallel worker processes (0 = one per semester)
+MARKS_TRAIN_WORKERS = int(os.getenv("MARKS_TRAIN_WORKERS", "0"))
 
 # Ensure directories exist
 os.makedirs("models/marks", exist_ok=True)
@@ -18,81 +22,102 @@ os.makedirs("models/marks", exist_ok=True)
 # Hardcoded maximum marks per semester
 MAX_MARKS = {1: 1000, 2: 1000, 3: 1000, 4: 1000, 5: 800, 6: 800}
 
-def train_models(data_path=DATA_FILE):
-    if not os.path.exists(data_path):
-        raise FileNotFoundError(f"Dataset not found at {data_path}")
-    
-    # Load dataset
+def load_marks_dataset(data_path=DATA_FILE, cache_path=DATA_CACHE_FILE):
+    # Parsing the workbook is the slow part, so it is only done once per change
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(data_path):
+        return pd.read_parquet(cache_path)
+
     dataset = pd.read_excel(data_path)
-    unique_sems = sorted(dataset['current_sem'].unique())
+    tmp_path = cache_path + ".tmp"
+    dataset.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+    return dataset
 
-    models = {}
-    scalers = {}
 
-    avg_mae_list = []
-    avg_r2_list = []
+def train_semester(sem, sem_data):
+    # Runs in a worker process; the log is printed by the parent so the
+    # output stays in semester order
+    log = [f'\n Training model for Semester {sem}...']
 
-    for sem in unique_sems:
-        if sem == 1:
-            continue  # Skip Semester 1 since there's no prior data
+    # Calculate percentages instead of total marks
+    for s in range(1, sem + 1):
+        if f"sem_{s}_marks_total" in sem_data.columns:
+            sem_data[f"sem_{s}_marks_percentage"] = (sem_data[f"sem_{s}_marks_total"] / MAX_MARKS[s]) * 100
 
-        print(f'\n Training model for Semester {sem}...')
+    # Define Features (Previous Semester Percentages + Current Attendance)
+    features = [f'sem_{s}_marks_percentage' for s in range(max(1, sem - 2), sem)]
+    features.append(f'sem_{sem}_attendance_perc')
 
-        sem_data = dataset[dataset['current_sem'] == sem].copy()
+    # Extract Data
+    X = sem_data[features]
+    y = sem_data[f'sem_{sem}_marks_percentage']
 
-        # Calculate percentages instead of total marks
-        for s in range(1, sem + 1):
-            if f"sem_{s}_marks_total" in sem_data.columns:
-                sem_data[f"sem_{s}_marks_percentage"] = (sem_data[f"sem_{s}_marks_total"] / MAX_MARKS[s]) * 100
+    # Scale Data
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
 
-        # Define Features (Previous Semester Percentages + Current Attendance)
-        features = [f'sem_{s}_marks_percentage' for s in range(max(1, sem - 2), sem)]
-        features.append(f'sem_{sem}_attendance_perc')
+    # Train/Test Split (Stratified for better generalization)
+    X_train, X_test, y_train, y_test = train_test_split(X_scaled, y, test_size=0.2, random_state=42)
 
-        # Extract Data
-        X = sem_data[features]
-        y = sem_data[f'sem_{sem}_marks_percentage']
+    # Train Model with Cross-Validation & Regularization
+    best_alpha = 10  # Increasing regularization to reduce overfitting
+    model = Ridge(alpha=best_alpha)
 
-        # Scale Data
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
+    # 5-Fold Cross-Validation for More Generalized Results
+    cv_scores = cross_val_score(model, X_train, y_train, cv=5, scoring='r2')
+    log.append(f"Cross-Validation R² for Semester {sem}: {np.mean(cv_scores):.2f}")
 
-        # Train/Test Split (Stratified for better generalization)
-        X_train, X_test, y_train, y_test = train_test_split(X_scaled, y, test_size=0.2, random_state=42)
+    # Train the Model
+    model.fit(X_train, y_train)
 
-        # Train Model with Cross-Validation & Regularization
-        best_alpha = 10  # Increasing regularization to reduce overfitting
-        model = Ridge(alpha=best_alpha)
+    # Evaluate
+    y_pred = model.predict(X_test)
+    mae = mean_absolute_error(y_test, y_pred)
+    r2 = r2_score(y_test, y_pred)
 
-        # 5-Fold Cross-Validation for More Generalized Results
-        cv_scores = cross_val_score(model, X_train, y_train, cv=5, scoring='r2')
-        print(f"Cross-Validation R² for Semester {sem}: {np.mean(cv_scores):.2f}")
+    log.append(f"MAE for Semester {sem}: {mae:.2f}")
+    log.append(f"R² Score for Semester {sem}: {r2:.2f}")
 
-        # Train the Model
-        model.fit(X_train, y_train)
+    return {"sem": sem, "model": model, "scaler": scaler, "mae": mae, "r2": r2, "log": log}
 
-        # Evaluate
-        y_pred = model.predict(X_test)
-        mae = mean_absolute_error(y_test, y_pred)
-        r2 = r2_score(y_test, y_pred)
 
-        print(f"MAE for Semester {sem}: {mae:.2f}")
-        print(f"R² Score for Semester {sem}: {r2:.2f}")
+def train_models(data_path=DATA_FILE):
+    if not os.path.exists(data_path):
+        raise FileNotFoundError(f"Dataset not found at {data_path}")
+    
+    # Load dataset
+    dataset = load_marks_dataset(data_path)
+    # Skip Semester 1 since there's no prior data
+    unique_sems = [int(sem) for sem in sorted(dataset['current_sem'].unique()) if sem != 1]
 
-        # Store results for averaging
-        avg_mae_list.append(mae)
-        avg_r2_list.append(r2)
+    models = {}
+    scalers = {}
 
-        # Save Model and Scaler
-        models[sem] = model
-        scalers[sem] = scaler
+    avg_mae_list = []
+    avg_r2_list = []
+
+    workers = MARKS_TRAIN_WORKERS or len(unique_sems) or 1
+    with ProcessPoolExecutor(max_workers=min(workers, os.cpu_count() or 1)) as executor:
+        # Each worker only receives its own semester's rows
+        futures = [
+            executor.submit(train_semester, sem, dataset[dataset['current_sem'] == sem].copy())
+            for sem in unique_sems
+        ]
+        results = [future.result() for future in futures]
+
+    for result in results:
+        sem = result["sem"]
+        print("\n".join(result["log"]))
+
+        # Store results for averaging
+        avg_mae_list.append(result["mae"])
+        avg_r2_list.append(result["r2"])
 
-    # Save using Pickle
-    with open(MODEL_FILE, "wb") as f:
-        pickle.dump(models, f)
+        models[sem] = result["model"]
+        scalers[sem] = result["scaler"]
 
-    with open(SCALER_FILE, "wb") as f:
-        pickle.dump(scalers, f)
+    # One bundle with every semester's coefficients and scaler statistics
+    save_marks_bundle(bundle_arrays(models, scalers), BUNDLE_FILE)
 
     # Compute Average Metrics
     avg_mae = np.mean(avg_mae_list)
@@ -0,0 +1,241 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import traceback
+from datetime import datetime
+
+# Full re-ingest + retrain + batch scoring, run as its own process so the Quart server keeps
+# its cores. A lock file makes sure only one run happens at a time and the
+# state file records the status of the last run for /pipeline/status.
+# Usage: python -m scripts.run_pipeline [--skip-ingest] [--nice 10] [--cpus 0-1] [--n-jobs 2]
+
+PIPELINE_DIR = os.getenv("PIPELINE_DIR", os.path.join("data", "pipeline"))
+PIPELINE_STATE_FILE = os.path.join(PIPELINE_DIR, "state.json")
+PIPELINE_LOCK_FILE = os.path.join(PIPELINE_DIR, "pipeline.lock")
+
+PIPELINE_NICE = int(os.getenv("PIPELINE_NICE", "10"))
+PIPELINE_CPUS = os.getenv("PIPELINE_CPUS", "")
+PIPELINE_N_JOBS = int(os.getenv("PIPELINE_N_JOBS", "2"))
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class PipelineLock:
+    # OS-level lock, released by the kernel even if the worker is killed.
+    # The holder's PID and name are written into the lock file, so other
+    # processes can see who runs without touching the lock.
+    def __init__(self, path=None, holder="pipeline"):
+        self.path = path or PIPELINE_LOCK_FILE
+        self.holder = holder
+        self._file = None
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, "a+")
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            self._file.close()
+            self._file = None
+            return False
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(f"{os.getpid()} {self.holder}\n")
+        self._file.flush()
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.flush()
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def lock_holder():
+    # {"pid": ..., "holder": ...} of the run holding the lock, or None.
+    # Only reads the lock file: a status poll must not make a starting
+    # pipeline see the lock as taken.
+    if fcntl is None:
+        # No safe signal-0 probe on Windows, fall back to trying the lock
+        lock = PipelineLock()
+        if not lock.acquire():
+            return {"pid": None, "holder": None}
+        lock.release()
+        return None
+    try:
+        with open(PIPELINE_LOCK_FILE) as f:
+            pid, _, holder = f.read().strip().partition(" ")
+    except FileNotFoundError:
+        return None
+    # Left behind by a killed holder when the PID is gone
+    if not pid.isdigit() or not _pid_alive(int(pid)):
+        return None
+    return {"pid": int(pid), "holder": holder}
+
+
+def pipeline_running():
+    return lock_holder() is not None
+
+
+def read_state():
+    if not os.path.exists(PIPELINE_STATE_FILE):
+        return {"status": "never_run"}
+    with open(PIPELINE_STATE_FILE) as f:
+        return json.load(f)
+
+
+def write_state(state):
+    os.makedirs(PIPELINE_DIR, exist_ok=True)
+    tmp_path = PIPELINE_STATE_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, PIPELINE_STATE_FILE)
+
+
+def _parse_cpus(spec):
+    # "0-1,4" -> {0, 1, 4}
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+
+def apply_cpu_limits(nice, cpus, n_jobs):
+    # Lower priority, optional CPU pinning and bounded training parallelism
+    if nice and hasattr(os, "nice"):
+        os.nice(nice)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, _parse_cpus(cpus))
+
+    import scripts.retrain_attendance_model as retrain
+    retrain.TRAIN_N_JOBS = n_jobs
+
+
+async def _run_stages(state, skip_ingest):
+    from db.attendance_data_fetch import process_all_students
+    from db.utils.flask_security import close_decrypt_client
+    from scripts.retrain_attendance_model import train_and_save_model
+    from scripts.score_all_students import score_all_students
+    from services import metrics
+    from services.model_registry import current_version
+
+    # DB and decrypt time of the whole run, exported by the server's /metrics
+    token = metrics.begin_scope("pipeline")
+    try:
+        if not skip_ingest:
+            start = time.perf_counter()
+            state["stage"] = "ingest"
+            write_state(state)
+            await process_all_students()
+            state["stages"]["ingest_seconds"] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        state["stage"] = "train"
+        write_state(state)
+        state["training"] = await train_and_save_model()
+        state["stages"]["train_seconds"] = round(time.perf_counter() - start, 3)
+        state["model_version"] = current_version()
+
+        # Precompute every student's predictions with the new model
+        start = time.perf_counter()
+        state["stage"] = "score"
+        write_state(state)
+        state["scoring"] = await score_all_students()
+        state["stages"]["score_seconds"] = round(time.perf_counter() - start, 3)
+    finally:
+        scope = metrics.end_scope(token)
+        if scope is not None:
+            state["breakdown"] = {stage: round(seconds, 3) for stage, seconds in scope.stages.items()}
+        await close_decrypt_client()
+
+
+def run_pipeline(skip_ingest=False, nice=None, cpus=None, n_jobs=None):
+    lock = PipelineLock()
+    if not lock.acquire():
+        print("Pipeline is already running")
+        return None
+
+    try:
+        apply_cpu_limits(PIPELINE_NICE if nice is None else nice,
+                         PIPELINE_CPUS if cpus is None else cpus,
+                         PIPELINE_N_JOBS if n_jobs is None else n_jobs)
+
+        started = time.perf_counter()
+        state = {
+            "status": "running",
+            "stage": None,
+            "pid": os.getpid(),
+            "started_at": datetime.now().isoformat(timespec='seconds'),
+            "finished_at": None,
+            "duration_seconds": None,
+            "stages": {},
+            "model_version": None,
+            "training": None,
+            "scoring": None,
+            "breakdown": None,
+            "error": None,
+        }
+        write_state(state)
+
+        try:
+            asyncio.run(_run_stages(state, skip_ingest))
+            state["status"] = "succeeded"
+        except Exception as e:
+            traceback.print_exc()
+            state["status"] = "failed"
+            state["error"] = str(e)
+
+        state["stage"] = None
+        state["finished_at"] = datetime.now().isoformat(timespec='seconds')
+        state["duration_seconds"] = round(time.perf_counter() - started, 3)
+        write_state(state)
+        print(f"Pipeline {state['status']} in {state['duration_seconds']}s")
+        return state
+    finally:
+        lock.release()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-ingest attendance data and retrain the attendance model")
+    parser.add_argument("--skip-ingest", action="store_true", help="retrain on the stored dataset only")
+    parser.add_argument("--nice", type=int, default=None)
+    parser.add_argument("--cpus", default=None, help='CPU list to pin the worker to, e.g. "0-1"')
+    parser.add_argument("--n-jobs", type=int, default=None, help="parallel jobs for the grid searches")
+    args = parser.parse_args()
+
+    state = run_pipeline(args.skip_ingest, args.nice, args.cpus, args.n_jobs)
+    sys.exit(0 if state is not None and state["status"] == "succeeded" else 1)
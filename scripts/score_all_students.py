@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+# Scores every student from fetch_unique_prns with the published models and
+# writes the results to the prediction store, which /predict-attendance and
+# /predict-marks serve from. Runs after each pipeline retrain and nightly.
+# PRNs are scored in chunks (one vectorised batch call per chunk) spread over
+# a process pool; every worker loads the models once.
+# Usage: python -m scripts.score_all_students [--workers 2] [--chunk-size 500]
+
+SCORE_WORKERS = int(os.getenv("SCORE_WORKERS", "2"))
+SCORE_CHUNK_SIZE = int(os.getenv("SCORE_CHUNK_SIZE", "500"))
+
+
+def _score_chunk(prns, week_data, students):
+    # Runs in a worker process. Failed predictions are left out of the
+    # store; the server computes those live.
+    from services.attendance_predictions import predict_attendance_batch
+    from services.marks_predictions import get_marks_bundle, predict_marks_batch
+    from services.model_registry import model_registry
+
+    artifacts = model_registry.current()
+    attendance = {}
+    if week_data:
+        for prn, result in predict_attendance_batch(week_data, prns, artifacts).items():
+            if "error" not in result:
+                attendance[str(prn)] = result
+
+    marks = {}
+    if not students.empty:
+        for prn, result in zip(students['prn'], predict_marks_batch(students)):
+            if "error" not in result:
+                marks.setdefault(str(prn), result)
+
+    versions = {
+        "model_version": artifacts.version,
+        "data_version": artifacts.summary.version,
+        "bundle_version": get_marks_bundle().version,
+    }
+    return attendance, marks, versions
+
+
+async def _fetch_inputs():
+    from db.attendance_data_fetch import fetch_unique_prns
+    from db.attendance_timetable_fetch import fetch_latest_timetable
+    from db.marks_data_fetch import fetch_students_data
+
+    prns = list(dict.fromkeys(await fetch_unique_prns()))
+    if not prns:
+        return prns, None, pd.DataFrame()
+    week_data = await fetch_latest_timetable(prns[0])
+    students = await fetch_students_data(prns)
+    return prns, week_data, students
+
+
+async def score_all_students(workers=None, chunk_size=None):
+    from db.attendance_data_fetch import load_watermark
+    from db.prediction_store import write_prediction_store
+    from services.marks_predictions import get_marks_bundle
+    from services.model_registry import current_version, summary_version
+
+    workers = workers or SCORE_WORKERS
+    chunk_size = chunk_size or SCORE_CHUNK_SIZE
+    start = time.perf_counter()
+
+    prns, week_data, students = await _fetch_inputs()
+    fetched = time.perf_counter()
+
+    model_version = current_version()
+    data_version = summary_version(load_watermark())
+    bundle_version = get_marks_bundle().version
+    expected = {"model_version": model_version, "data_version": data_version, "bundle_version": bundle_version}
+    chunks = [prns[i:i + chunk_size] for i in range(0, len(prns), chunk_size)]
+
+    results = {"attendance": {}, "marks": {}}
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(chunks) or 1))) as executor:
+        futures = [
+            loop.run_in_executor(
+                executor, _score_chunk, chunk, week_data,
+                students[students['prn'].isin(chunk)] if not students.empty else students,
+            )
+            for chunk in chunks
+        ]
+        for attendance, marks, versions in await asyncio.gather(*futures):
+            # A retrain or ingestion run mid-scoring would mix two versions
+            if versions != expected:
+                raise RuntimeError(f"Model or data changed while scoring ({versions}), not publishing")
+            results["attendance"].update(attendance)
+            results["marks"].update(marks)
+
+    week_number = week_data['week_number'][0] if week_data else None
+    write_prediction_store(results, {
+        "attendance": {"model_version": model_version, "week_number": week_number, "data_version": data_version},
+        "marks": {"bundle_version": bundle_version},
+    })
+
+    report = {
+        "students": len(prns),
+        "attendance_rows": len(results["attendance"]),
+        "marks_rows": len(results["marks"]),
+        "model_version": model_version,
+        "week_number": week_number,
+        "fetch_seconds": round(fetched - start, 3),
+        "score_seconds": round(time.perf_counter() - fetched, 3),
+    }
+    print(f"Scored {len(prns)} students in {report['fetch_seconds'] + report['score_seconds']:.3f}s "
+          f"({report['attendance_rows']} attendance, {report['marks_rows']} marks predictions)")
+    return report
+
+
+async def _main(workers, chunk_size):
+    from db.utils.flask_security import close_decrypt_client
+    try:
+        return await score_all_students(workers, chunk_size)
+    finally:
+        await close_decrypt_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute attendance and marks predictions for every student")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(_main(args.workers, args.chunk_size))
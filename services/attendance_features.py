@@ -0,0 +1,52 @@
+import pandas as pd
+
+# Attendance trend features, shared by training (computed over the whole
+# dataset and stored with the processed attendance) and serving (looked up
+# from the stored values through the trend index).
+
+# Feature column -> the group it averages attendance_percentage over
+TREND_GROUPS = {
+    'attendance_percentage_weekly': ['prn', 'subject', 'week_number'],
+    'attendance_percentage_daily': ['prn', 'weekday'],
+    'lecture_type_attendance_percentage': ['prn', 'lecture_type'],
+    'lecture_timing_attendance_percentage': ['prn', 'time_in_minutes'],
+    'teacher_probability': ['teacher', 'subject'],
+}
+TREND_COLUMNS = list(TREND_GROUPS)
+
+
+def add_trend_features(dataset):
+    # Adds weekday, attendance_percentage and the TREND_COLUMNS in place.
+    # Each group mean is broadcast back onto its rows with transform, so no
+    # intermediate tables are merged (and copied) into the dataset.
+    dataset['weekday'] = dataset['date'].dt.day_name()
+    dataset['attendance_percentage'] = dataset['attendance'] * 100
+
+    percentage = dataset['attendance_percentage']
+    for col, keys in TREND_GROUPS.items():
+        # dropna=False: rows with a missing key form their own group, as
+        # they did when these were joined back with merge
+        grouped = percentage.groupby([dataset[key] for key in keys], observed=True, sort=False, dropna=False)
+        dataset[col] = grouped.transform('mean')
+    return dataset
+
+
+def attach_trend_features(batch_df, trend_index):
+    # Look up attendance trends for each row in the flattened dataset
+    attendance_trends = [
+        trend_index.lookup(prn, subject, teacher, lecture_type, timing)
+        for prn, subject, teacher, lecture_type, timing in zip(
+            batch_df['prn'], batch_df['subject'], batch_df['teacher'],
+            batch_df['lecture_type'], batch_df['time_in_minutes'])
+    ]
+
+    for col, values in zip(TREND_COLUMNS, zip(*attendance_trends)):
+        batch_df[col] = pd.Series(values, index=batch_df.index, dtype='float64')
+
+    # Missing trends are filled with the student's own mean for the week
+    if batch_df[TREND_COLUMNS].isna().any().any():
+        trend_positions = [batch_df.columns.get_loc(col) for col in TREND_COLUMNS]
+        for rows in batch_df.groupby('prn', sort=False).indices.values():
+            block = batch_df.iloc[rows, trend_positions]
+            batch_df.iloc[rows, trend_positions] = block.fillna(block.mean())
+    return batch_df
@@ -1,193 +1,117 @@
-import pickle
+from datetime import datetime
+from functools import lru_cache
 import pandas as pd
 import numpy as np
-import os
-
-MODEL_FOLDER = os.path.join("models", "attendance")
-with open(os.path.join(MODEL_FOLDER, 'le_day.pkl'), 'rb') as f:
-    le_day = pickle.load(f)
-with open(os.path.join(MODEL_FOLDER, 'le_subject.pkl'), 'rb') as f:
-    le_subject = pickle.load(f)
-with open(os.path.join(MODEL_FOLDER, 'le_teacher.pkl'), 'rb') as f:
-    le_teacher = pickle.load(f)
-with open(os.path.join(MODEL_FOLDER, 'le_lecture_type.pkl'), 'rb') as f:
-    le_lecture_type = pickle.load(f)
-with open(os.path.join(MODEL_FOLDER, 'scaler.pkl'), 'rb') as f:
-    scaler = pickle.load(f)
-with open(os.path.join(MODEL_FOLDER, 'voting_model.pkl'), 'rb') as model_file:
-    voting_model = pickle.load(model_file)
-
-def predict_attendance(week_data, dataset):
-    week_df = pd.DataFrame(week_data)
-    week_df['day_name'] = le_day.transform(week_df['day_name'])
-
-    flattened_data = []
-
-    # Flatten input data for prediction
-    for _, row in week_df.iterrows():
-        day = row['day_name']
-        prn = row['prn']
-        for subject, teacher, lecture_type, timing in zip(row['subject'], row['teacher'], row['lecture_type'], row['lecture_timing']):
-            flattened_data.append({
-                'prn': prn,
-                'subject': subject,
-                'teacher': teacher,
-                'day_name': day,
-                'lecture_type': lecture_type,
-                'time_in_minutes': pd.to_datetime(timing, format='%I:%M:%S %p').hour * 60,
-                'week_number': row['week_number']
-            })
-
-    flattened_df = pd.DataFrame(flattened_data)
-    flattened_df['subject'] = le_subject.transform(flattened_df['subject'])
-    flattened_df['teacher'] = le_teacher.transform(flattened_df['teacher'])
-    flattened_df['lecture_type'] = le_lecture_type.transform(flattened_df['lecture_type'])
-    
-    # Get attendance trends for each row in the flattened dataset
-    def get_attendance_trends(prn, subject, teacher, lecture_type, lecture_timing, max_weeks=5):
-        current_week = dataset['week_number'].max()
-
-        trends = dataset[(dataset['prn'] == prn) & 
-                        (dataset['subject'] == subject) & 
-                        (dataset['teacher'] == teacher) & 
-                        (dataset['lecture_type'] == lecture_type) & 
-                        (dataset['time_in_minutes'] == lecture_timing) & 
-                        (dataset['week_number'] >= current_week - max_weeks)]
-        
-        if not trends.empty:
-            return (
-                trends['attendance_percentage_weekly'].mean(),
-                trends['attendance_percentage_daily'].mean(),
-                trends['lecture_type_attendance_percentage'].mean(),
-                trends['lecture_timing_attendance_percentage'].mean(),
-                trends['teacher_probability'].mean()
-            )
-        else:          
-            trends_fallback = dataset[(dataset['prn'] == prn) & 
-                                    (dataset['subject'] == subject) & 
-                                    (dataset['teacher'] == teacher)]
-            
-            if not trends_fallback.empty:
-                return (
-                    trends_fallback['attendance_percentage_weekly'].mean(),
-                    trends_fallback['attendance_percentage_daily'].mean(),
-                    trends_fallback['lecture_type_attendance_percentage'].mean(),
-                    trends_fallback['lecture_timing_attendance_percentage'].mean(),
-                    trends_fallback['teacher_probability'].mean()
-                )
-            
-            trends_fallback = dataset[(dataset['prn'] == prn) & 
-                                    (dataset['subject'] == subject) & 
-                                    (dataset['day_name'] == lecture_timing)]
-            
-            if not trends_fallback.empty:
-                return (
-                    trends_fallback['attendance_percentage_weekly'].mean(),
-                    trends_fallback['attendance_percentage_daily'].mean(),
-                    trends_fallback['lecture_type_attendance_percentage'].mean(),
-                    trends_fallback['lecture_timing_attendance_percentage'].mean(),
-                    trends_fallback['teacher_probability'].mean()
-                )
-
-            trends_fallback = dataset[(dataset['prn'] == prn) & 
-                                    (dataset['subject'] == subject) & 
-                                    (dataset['lecture_type'] == lecture_type)]
-            
-            if not trends_fallback.empty:
-                return (
-                    trends_fallback['attendance_percentage_weekly'].mean(),
-                    trends_fallback['attendance_percentage_daily'].mean(),
-                    trends_fallback['lecture_type_attendance_percentage'].mean(),
-                    trends_fallback['lecture_timing_attendance_percentage'].mean(),
-                    trends_fallback['teacher_probability'].mean()
-                )
-
-            trends_fallback = dataset[(dataset['prn'] == prn) & 
-                                    (dataset['subject'] == subject) & 
-                                    (dataset['time_in_minutes'] == lecture_timing)]
-            
-            if not trends_fallback.empty:
-                return (
-                    trends_fallback['attendance_percentage_weekly'].mean(),
-                    trends_fallback['attendance_percentage_daily'].mean(),
-                    trends_fallback['lecture_type_attendance_percentage'].mean(),
-                    trends_fallback['lecture_timing_attendance_percentage'].mean(),
-                    trends_fallback['teacher_probability'].mean()
-                )          
-            return None, None, 0, 0, 0
-
-    attendance_trends = []
-    for _, row in flattened_df.iterrows():
-        trends = get_attendance_trends(row['prn'], row['subject'], row['teacher'], row['lecture_type'], row['time_in_minutes'])
-        attendance_trends.append(trends)
-
-    (flattened_df['attendance_percentage_weekly'], 
-        flattened_df['attendance_percentage_daily'], 
-        flattened_df['lecture_type_attendance_percentage'], 
-        flattened_df['lecture_timing_attendance_percentage'],
-        flattened_df['teacher_probability']) = zip(*attendance_trends)
-    
-    flattened_df.fillna(flattened_df.mean(), inplace=True)
-
-    features = ['prn', 'subject', 'teacher', 'day_name', 'lecture_type', 
-            'time_in_minutes', 'week_number', 'attendance_percentage_weekly', 
-            'attendance_percentage_daily', 'teacher_probability', 
-            'lecture_type_attendance_percentage', 'lecture_timing_attendance_percentage']
-    
-    flattened_df_scaled = scaler.transform(flattened_df[features])
-
-    flattened_df['predictions'] = voting_model.predict_proba(flattened_df_scaled)[:, 1]
-
-    flattened_df['weighted_prediction'] = flattened_df.groupby(['day_name'])['predictions'].transform('mean')
+from services import metrics
+from services.attendance_features import TREND_COLUMNS, attach_trend_features
 
-    average_predictions = flattened_df.groupby('day_name')['weighted_prediction'].mean().reset_index()
+FEATURES = ['prn', 'subject', 'teacher', 'day_name', 'lecture_type',
+            'time_in_minutes', 'week_number', 'attendance_percentage_weekly',
+            'attendance_percentage_daily', 'teacher_probability',
+            'lecture_type_attendance_percentage', 'lecture_timing_attendance_percentage']
 
-    average_predictions.columns = ['day_name', 'average_prediction']
+# Columns of the processed dataset read at startup (features, trend lookup
+# keys and the attendance target)
+DATASET_COLUMNS = ['prn', 'subject', 'teacher', 'day_name', 'lecture_type', 'time_in_minutes',
+                   'week_number', 'attendance'] + TREND_COLUMNS
 
-    average_predictions['day_name'] = le_day.inverse_transform(average_predictions['day_name'])
+DAY_ORDER = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
 
-    day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
 
-    average_predictions['day_order'] = average_predictions['day_name'].apply(lambda x: day_order.index(x))
+# The encoders, scaler and model come from the artifact set the caller took
+# from services.model_registry, so one request never mixes two versions.
 
-    average_predictions_sorted = average_predictions.sort_values('day_order')
 
-    average_predictions_sorted = average_predictions_sorted.drop(columns='day_order')
+@lru_cache(maxsize=1024)
+def _lecture_minutes(timing):
+    # Only the hour counts, as before ("11:30:00 AM" -> 660)
+    return datetime.strptime(timing, '%I:%M:%S %p').hour * 60
 
-    prn_to_filter = week_df['prn'][0]
-    overall_attendance_data = dataset[dataset['prn'] == prn_to_filter]
 
-    # Calculate the current attendance for each subject
-    attendance_by_subject = (
-        overall_attendance_data.groupby('subject')['attendance']
-        .mean()  # Mean of attendance (1 for present, 0 for absent)
-        .reset_index()
+def _flatten_week(week_data, artifacts):
+    # One row per lecture. Each day keeps as many lectures as its shortest
+    # list (zip semantics: the timing list holds only the earliest lecture),
+    # the lists are concatenated and the per-day values repeated to match.
+    list_columns = [week_data['subject'], week_data['teacher'], week_data['lecture_type'], week_data['lecture_timing']]
+    lengths = [min(map(len, day_lists)) for day_lists in zip(*list_columns)]
+    subjects, teachers, lecture_types, timings = (
+        [value for day_values, n in zip(column, lengths) for value in day_values[:n]]
+        for column in list_columns
     )
 
-    attendance_by_subject['attendance_percentage'] = attendance_by_subject['attendance'] * 100
-    attendance_by_subject = attendance_by_subject.drop(columns=['attendance'])
-
-    # Decode the subject labels
-    attendance_by_subject['subject'] = le_subject.inverse_transform(attendance_by_subject['subject'])
-
-    # Calculate the total number of lectures and the current attended lectures
-    attendance_by_subject['total_lectures'] = overall_attendance_data.groupby('subject')['attendance'].count().values
-    attendance_by_subject['attended_lectures'] = attendance_by_subject['attendance_percentage'] * attendance_by_subject['total_lectures'] / 100
-
-    # Calculate the new percentage if the student attends the next lecture
-    attendance_by_subject['new_percentage_attend'] = (
-        (attendance_by_subject['attended_lectures'] + 1) / (attendance_by_subject['total_lectures'] + 1)
-    ) * 100
-
-    # Calculate the new percentage if the student misses the next lecture
-    attendance_by_subject['new_percentage_miss'] = (
-        attendance_by_subject['attended_lectures'] / (attendance_by_subject['total_lectures'] + 1)
-    ) * 100
-
-    # Create a result structure to return
-    result = {
-        "attendance_by_subject": attendance_by_subject[['subject', 'attendance_percentage', 'new_percentage_attend', 'new_percentage_miss']].to_dict(orient='records'),
-        "daily_predictions": average_predictions_sorted.to_dict(orient='records')
-    }
-
+    # Labels the model was not trained on get UNKNOWN_CODE (and are counted)
+    encoders = artifacts.encoders
+    return pd.DataFrame({
+        'prn': np.repeat(np.asarray(week_data['prn']), lengths),
+        'subject': encoders.encode('subject', subjects),
+        'teacher': encoders.encode('teacher', teachers),
+        'day_name': np.repeat(encoders.encode('day_name', week_data['day_name']), lengths),
+        'lecture_type': encoders.encode('lecture_type', lecture_types),
+        'time_in_minutes': np.fromiter((_lecture_minutes(t) for t in timings), dtype=np.int64, count=len(timings)),
+        'week_number': np.repeat(np.asarray(week_data['week_number'], dtype=np.int64), lengths),
+    })
+
+
+def _repeat_for_prns(flattened_df, prns):
+    # The timetable is the same for every student, so the flattened week is
+    # built once and stacked per PRN.
+    rows = np.tile(np.arange(len(flattened_df)), len(prns))
+    batch_df = flattened_df.iloc[rows].reset_index(drop=True)
+    batch_df['prn'] = pd.Series([prn for prn in prns for _ in range(len(flattened_df))], dtype=object).infer_objects()
+    return batch_df
+
+
+def _daily_predictions(batch_df, encoders):
+    batch_df['weighted_prediction'] = batch_df.groupby(['prn', 'day_name'])['predictions'].transform('mean')
+
+    average_predictions = batch_df.groupby(['prn', 'day_name'])['weighted_prediction'].mean().reset_index()
+    average_predictions.columns = ['prn', 'day_name', 'average_prediction']
+    average_predictions['day_name'] = encoders.decode('day_name', average_predictions['day_name'])
+    average_predictions['day_order'] = average_predictions['day_name'].apply(
+        lambda x: DAY_ORDER.index(x) if x in DAY_ORDER else len(DAY_ORDER))
+
+    daily_predictions = {}
+    for prn, group in average_predictions.groupby('prn', sort=False):
+        group = group.sort_values('day_order')
+        daily_predictions[prn] = group[['day_name', 'average_prediction']].to_dict(orient='records')
+    return daily_predictions
+
+
+def predict_attendance_batch(week_data, prns, artifacts):
+    prns = list(dict.fromkeys(prns))
+    with metrics.stage("features"):
+        batch_df = _repeat_for_prns(_flatten_week(week_data, artifacts), prns)
+        batch_df = attach_trend_features(batch_df, artifacts.trend_index)
+
+        # Students without any usable attendance history cannot be scored; keep
+        # them out of the model call so they don't fail the rest of the batch.
+        unscorable = set(batch_df.loc[batch_df[FEATURES].isna().any(axis=1), 'prn'])
+        batch_df = batch_df[~batch_df['prn'].isin(unscorable)].copy()
+
+    daily_predictions = {}
+    if not batch_df.empty:
+        # One scaler/model call for every student in the batch
+        with metrics.stage("model"):
+            batch_df['predictions'] = artifacts.predict_proba(batch_df[FEATURES])
+        with metrics.stage("aggregate"):
+            daily_predictions = _daily_predictions(batch_df, artifacts.encoders)
+
+    results = {}
+    for prn in prns:
+        if prn in unscorable:
+            results[prn] = {"error": "Not enough attendance history to predict for this PRN"}
+            continue
+        results[prn] = {
+            # Running per-subject counts, see services.attendance_summary
+            "attendance_by_subject": artifacts.summary.lookup(prn),
+            "daily_predictions": daily_predictions.get(prn, [])
+        }
+    return results
+
+
+def predict_attendance(week_data, artifacts):
+    prn = week_data['prn'][0]
+    result = predict_attendance_batch(week_data, [prn], artifacts)[prn]
+    if "error" in result:
+        raise ValueError(result["error"])
     return result
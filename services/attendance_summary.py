@@ -0,0 +1,76 @@
+import threading
+
+# Running attended/total lecture counts per (prn, subject), so the
+# attendance_by_subject part of a prediction is a lookup over the student's
+# subjects instead of a scan of the whole dataset. Built from the stored
+# attendance rows when a model version is loaded and updated with the rows
+# each incremental ingestion run adds or replaces.
+
+SUMMARY_COLUMNS = ['prn', 'subject', 'attendance']
+
+
+def _count_rows(rows):
+    # {(prn, subject): (attended, total)} for a frame of SUMMARY_COLUMNS
+    rows = rows.dropna(subset=['prn', 'subject'])
+    if rows.empty:
+        return {}
+    grouped = rows.groupby([rows['prn'], rows['subject'].astype(str)], observed=True, sort=False)['attendance']
+    counts = grouped.agg(['sum', 'count'])
+    return {
+        (int(prn), subject): (int(attended), int(total))
+        for (prn, subject), attended, total in zip(counts.index, counts['sum'], counts['count'])
+    }
+
+
+class AttendanceSummary:
+    def __init__(self, rows, version=None):
+        self._lock = threading.Lock()
+        self._counts = {}
+        for (prn, subject), (attended, total) in _count_rows(rows).items():
+            self._counts.setdefault(prn, {})[subject] = [attended, total]
+        self.version = version
+        self.updates = 0
+
+    def apply(self, added=None, removed=None, version=None):
+        # `removed` are the stored rows the ingestion run re-read and `added` replaced
+        with self._lock:
+            for rows, sign in [(removed, -1), (added, 1)]:
+                if rows is None:
+                    continue
+                for (prn, subject), (attended, total) in _count_rows(rows[SUMMARY_COLUMNS]).items():
+                    counts = self._counts.setdefault(prn, {}).setdefault(subject, [0, 0])
+                    counts[0] += sign * attended
+                    counts[1] += sign * total
+                    if counts[1] <= 0:
+                        del self._counts[prn][subject]
+            if version is not None:
+                self.version = version
+            self.updates += 1
+
+    def lookup(self, prn):
+        # Same figures (and float arithmetic) as the former groupby over the
+        # student's rows, subjects in label order
+        with self._lock:
+            counts = sorted((subject, attended, total) for subject, (attended, total) in self._counts.get(prn, {}).items())
+
+        by_subject = []
+        for subject, attended, total in counts:
+            attendance_percentage = attended / total * 100
+            attended_lectures = attendance_percentage * total / 100
+            by_subject.append({
+                'subject': subject,
+                'attendance_percentage': attendance_percentage,
+                # If the student attends / misses the next lecture
+                'new_percentage_attend': ((attended_lectures + 1) / (total + 1)) * 100,
+                'new_percentage_miss': (attended_lectures / (total + 1)) * 100,
+            })
+        return by_subject
+
+    def stats(self):
+        with self._lock:
+            return {
+                "students": len(self._counts),
+                "entries": sum(len(subjects) for subjects in self._counts.values()),
+                "version": self.version,
+                "updates": self.updates,
+            }
@@ -0,0 +1,79 @@
+import numpy as np
+from services.attendance_features import TREND_COLUMNS
+
+# Fallback chain used by predict_attendance, most specific first.
+# The third level matches day_name against the lecture time, exactly like the
+# original boolean-mask lookup did, so the results stay identical.
+RECENT_KEYS = ['prn', 'subject', 'teacher', 'lecture_type', 'time_in_minutes']
+FALLBACK_KEYS = [
+    ['prn', 'subject', 'teacher'],
+    ['prn', 'subject', 'day_name'],
+    ['prn', 'subject', 'lecture_type'],
+    ['prn', 'subject', 'time_in_minutes'],
+]
+
+MISSING_TRENDS = (None, None, 0, 0, 0)
+
+
+def _column_mean(values):
+    # Same reduction as pandas Series.mean (NaN skipped, pairwise sum), so the
+    # cached means are bit-for-bit equal to the old per-request filters.
+    mask = np.isnan(values)
+    if mask.any():
+        values = np.where(mask, 0.0, values)
+    count = values.size - int(mask.sum())
+    if count == 0:
+        return np.nan
+    return values.sum() / count
+
+
+class AttendanceTrendIndex:
+    def __init__(self, dataset, max_weeks=5):
+        self.levels = []
+        self._means = {}
+
+        if dataset.empty:
+            self._columns = []
+            return
+
+        self._columns = [dataset[col].to_numpy(dtype='float64') for col in TREND_COLUMNS]
+
+        current_week = dataset['week_number'].max()
+        recent = dataset['week_number'].to_numpy() >= current_week - max_weeks
+        recent_rows = np.flatnonzero(recent)
+        recent_groups = dataset[recent].groupby(RECENT_KEYS, sort=False).indices
+        self.levels.append(
+            {key: recent_rows[positions] for key, positions in recent_groups.items()}
+        )
+
+        for keys in FALLBACK_KEYS:
+            self.levels.append(dataset.groupby(keys, sort=False).indices)
+
+    def _trend_means(self, level, key):
+        cache_key = (level, key)
+        means = self._means.get(cache_key)
+        if means is None:
+            rows = self.levels[level][key]
+            means = tuple(_column_mean(column[rows]) for column in self._columns)
+            self._means[cache_key] = means
+        return means
+
+    def lookup(self, prn, subject, teacher, lecture_type, lecture_timing):
+        if not self.levels:
+            return MISSING_TRENDS
+
+        candidates = [
+            (prn, subject, teacher, lecture_type, lecture_timing),
+            (prn, subject, teacher),
+            (prn, subject, lecture_timing),
+            (prn, subject, lecture_type),
+            (prn, subject, lecture_timing),
+        ]
+        for level, key in enumerate(candidates):
+            if key in self.levels[level]:
+                return self._trend_means(level, key)
+        return MISSING_TRENDS
+
+
+def build_trend_index(dataset, max_weeks=5):
+    return AttendanceTrendIndex(dataset, max_weeks=max_weeks)
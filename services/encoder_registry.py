@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+import numpy as np
+
+# Hash-map replacements for the LabelEncoder pickles. Forward (label -> code)
+# and inverse (code -> label) tables are built once per model version;
+# categories the model was not trained on map to UNKNOWN_CODE and are counted
+# instead of failing the request.
+
+UNKNOWN_CODE = -1
+UNKNOWN_LABEL = "Unknown"
+MAX_UNSEEN_EXAMPLES = 20
+
+# Column name -> LabelEncoder pickle written by training
+ENCODER_COLUMNS = {
+    'subject': 'le_subject',
+    'teacher': 'le_teacher',
+    'day_name': 'le_day',
+    'lecture_type': 'le_lecture_type',
+    'festival': 'le_festival',
+}
+
+
+class CategoryEncoder:
+    def __init__(self, classes):
+        self.classes = list(classes)
+        self.forward = {label: code for code, label in enumerate(self.classes)}
+        # UNKNOWN_CODE (-1) indexes the trailing placeholder
+        self.inverse = np.array(self.classes + [UNKNOWN_LABEL], dtype=object)
+        self._lock = threading.Lock()
+        self.unknown = 0
+        self.unseen = set()
+
+    def encode(self, labels):
+        forward = self.forward
+        codes = np.fromiter((forward.get(label, UNKNOWN_CODE) for label in labels), dtype=np.int64, count=len(labels))
+        missing = codes == UNKNOWN_CODE
+        if missing.any():
+            with self._lock:
+                self.unknown += int(missing.sum())
+                for label in np.asarray(labels, dtype=object)[missing]:
+                    if len(self.unseen) >= MAX_UNSEEN_EXAMPLES:
+                        break
+                    self.unseen.add(str(label))
+        return codes
+
+    def decode(self, codes):
+        codes = np.asarray(codes, dtype=np.int64)
+        codes = np.where((codes >= 0) & (codes < len(self.classes)), codes, UNKNOWN_CODE)
+        return self.inverse[codes]
+
+    def stats(self):
+        with self._lock:
+            return {"classes": len(self.classes), "unknown": self.unknown, "unseen_examples": sorted(self.unseen)}
+
+
+class EncoderRegistry:
+    def __init__(self, tables):
+        self.encoders = {col: CategoryEncoder(classes) for col, classes in tables.items()}
+
+    def encode(self, col, labels):
+        return self.encoders[col].encode(labels)
+
+    def decode(self, col, codes):
+        return self.encoders[col].decode(codes)
+
+    def classes(self, col):
+        return self.encoders[col].classes
+
+    def tables(self):
+        return {col: encoder.classes for col, encoder in self.encoders.items()}
+
+    def stats(self):
+        return {col: encoder.stats() for col, encoder in self.encoders.items()}
+
+
+def tables_from_label_encoders(label_encoders):
+    # {'le_subject': LabelEncoder, ...} -> {'subject': [classes], ...}
+    return {
+        col: label_encoders[name].classes_.tolist()
+        for col, name in ENCODER_COLUMNS.items()
+        if name in label_encoders
+    }
+
+
+def save_encoder_tables(tables, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(tables, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def load_encoder_tables(payload):
+    return json.loads(payload)
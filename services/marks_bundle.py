@@ -0,0 +1,109 @@
+import hashlib
+import io
+import os
+import pickle
+import numpy as np
+
+# Per-semester marks models in one .npz: Ridge coefficients/intercept, the
+# StandardScaler mean/scale and the feature names, stored as sem_<n>_* arrays.
+# At load time scaling and the linear model are folded into one affine
+# transform per semester: X @ weights + bias.
+
+MODEL_FOLDER = os.path.join('models', 'marks')
+BUNDLE_FILE = os.path.join(MODEL_FOLDER, 'marks_bundle.npz')
+# Pickles the bundle is built from when it hasn't been exported yet
+LEGACY_MODEL_FILE = os.path.join(MODEL_FOLDER, 'linear_model.pkl')
+LEGACY_SCALER_FILE = os.path.join(MODEL_FOLDER, 'scaler.pkl')
+
+ARRAY_NAMES = ['features', 'coef', 'intercept', 'mean', 'scale']
+
+
+class MarksBundle:
+    def __init__(self, arrays, version=None):
+        self.arrays = arrays
+        self.version = version
+        self.semesters = {}
+        for sem in sorted({int(name.split('_')[1]) for name in arrays}):
+            coef = arrays[f'sem_{sem}_coef'].astype(np.float64)
+            mean = arrays[f'sem_{sem}_mean'].astype(np.float64)
+            scale = arrays[f'sem_{sem}_scale'].astype(np.float64)
+            weights = coef / scale
+            self.semesters[sem] = {
+                'features': [str(name) for name in arrays[f'sem_{sem}_features']],
+                'weights': weights,
+                'bias': float(arrays[f'sem_{sem}_intercept']) - float(mean @ weights),
+            }
+
+    def __contains__(self, sem):
+        return sem in self.semesters
+
+    def features(self, sem):
+        return self.semesters[sem]['features']
+
+    def predict(self, sem, X):
+        # Same as model.predict(scaler.transform(X)) up to rounding
+        semester = self.semesters[sem]
+        return np.asarray(X, dtype=np.float64) @ semester['weights'] + semester['bias']
+
+
+def bundle_arrays(models, scalers):
+    # {sem: Ridge}, {sem: StandardScaler} -> arrays for save_marks_bundle
+    arrays = {}
+    for sem, model in models.items():
+        scaler = scalers[sem]
+        features = getattr(scaler, 'feature_names_in_', None)
+        if features is None:
+            raise ValueError(f"Scaler for Semester {sem} has no feature names")
+        sem = int(sem)
+        arrays[f'sem_{sem}_features'] = np.asarray(features, dtype=str)
+        arrays[f'sem_{sem}_coef'] = np.asarray(model.coef_, dtype=np.float64)
+        arrays[f'sem_{sem}_intercept'] = np.asarray(model.intercept_, dtype=np.float64)
+        arrays[f'sem_{sem}_mean'] = np.asarray(scaler.mean_, dtype=np.float64)
+        arrays[f'sem_{sem}_scale'] = np.asarray(scaler.scale_, dtype=np.float64)
+    return arrays
+
+
+def save_marks_bundle(arrays, path=None):
+    path = path or BUNDLE_FILE
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _payload_version(payload):
+    return hashlib.sha256(payload).hexdigest()[:12]
+
+
+def bundle_version(path=None):
+    # Version load_marks_bundle would report, without building the bundle
+    path = path or BUNDLE_FILE
+    if not os.path.exists(path):
+        return "legacy"
+    with open(path, 'rb') as f:
+        return _payload_version(f.read())
+
+
+def load_marks_bundle(path=None):
+    path = path or BUNDLE_FILE
+    if not os.path.exists(path):
+        return MarksBundle(legacy_bundle_arrays(), version="legacy")
+    with open(path, 'rb') as f:
+        payload = f.read()
+    version = _payload_version(payload)
+    with np.load(io.BytesIO(payload)) as arrays:
+        return MarksBundle({name: arrays[name] for name in arrays.files}, version)
+
+
+def legacy_bundle_arrays():
+    with open(LEGACY_MODEL_FILE, 'rb') as f:
+        models = pickle.load(f)
+    with open(LEGACY_SCALER_FILE, 'rb') as f:
+        scalers = pickle.load(f)
+    return bundle_arrays(models, scalers)
+
+
+if __name__ == "__main__":
+    # One-off export of the pickled models: python -m services.marks_bundle
+    save_marks_bundle(legacy_bundle_arrays())
+    print(f"Wrote {BUNDLE_FILE}")
@@ -1,97 +1,168 @@
-import pickle
+import logging
+import threading
 import numpy as np
 import pandas as pd
-import os
-MODEL_FOLDER = os.path.join('models/marks')
-
-with open(os.path.join(MODEL_FOLDER, 'linear_model.pkl'), 'rb') as f:
-    loaded_model = pickle.load(f)
+from services import metrics
+from services.marks_bundle import bundle_version, load_marks_bundle
+
+# Scaler + Ridge model of every semester, as one affine transform each.
+# Loaded on first use (or by the server's warm-up task) and swapped by
+# reload_marks_bundle once retraining has written a new bundle.
+_marks_bundle = None
+_marks_bundle_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def get_marks_bundle():
+    global _marks_bundle
+    if _marks_bundle is None:
+        with _marks_bundle_lock:
+            if _marks_bundle is None:
+                _marks_bundle = load_marks_bundle()
+    return _marks_bundle
+
+
+def marks_bundle_loaded():
+    return _marks_bundle is not None
+
+
+def reload_marks_bundle():
+    # Returns True when a new bundle was swapped in; a bundle that was never
+    # loaded is left to the first request. The old one is kept on errors.
+    global _marks_bundle
+    with _marks_bundle_lock:
+        active = _marks_bundle
+        if active is None:
+            return False
+        try:
+            if bundle_version() == active.version:
+                return False
+            candidate = load_marks_bundle()
+        except Exception as e:
+            logger.error(f"Keeping marks bundle version {active.version}: {e}")
+            return False
+        _marks_bundle = candidate
+    logger.info(f"Marks bundle version {candidate.version} is now active")
+    return True
+
+GRADE_THRESHOLDS = {
+    "O": 80, "A+": 70, "A": 60, "B+": 55, "B": 50, "C": 45, "D": 40, "F": 0
+}
+
+
+def _column(students, column, default):
+    if column in students.columns:
+        return students[column]
+    return pd.Series(default, index=students.index)
+
+
+def _grade_ranges(percentages):
+    percentages = np.asarray(percentages, dtype=float)
+    conditions = [percentages >= threshold for threshold in GRADE_THRESHOLDS.values()]
+    return np.select(conditions, list(GRADE_THRESHOLDS), default="F").tolist()
+
+
+def _previous_sem_data(students, semester, total_obtainable_marks):
+    # Column-wise equivalent of looking up one earlier semester per student
+    if semester < 1:
+        count = len(students)
+        return {"marks": ["N/A"] * count, "total_obtainable": ["N/A"] * count,
+                "perc": [None] * count, "grade": ["N/A"] * count}
+
+    marks = _column(students, f"sem_{semester}_marks_total", 0)
+    total_marks = total_obtainable_marks[semester]
+    perc = (marks / total_marks) * 100
+    return {
+        "marks": marks.tolist(),
+        "total_obtainable": total_marks.tolist(),
+        "perc": [round(p, 2) if t > 0 else None for p, t in zip(perc.tolist(), total_marks.tolist())],
+        "grade": _grade_ranges(perc),
+    }
+
+
+def _predict_semester(students, latest_sem, total_obtainable_marks, marks_bundle):
+    count = len(students)
+    if latest_sem not in total_obtainable_marks:
+        return [{"error": f"Total obtainable marks for Semester {latest_sem} is missing"}] * count
+
+    feature_names = [f"sem_{s}_marks_percentage" for s in range(max(1, latest_sem - 2), latest_sem)]
+    feature_names.append(f"sem_{latest_sem}_attendance_perc")
+    with metrics.stage("features"):
+        input_features_df = pd.DataFrame({name: _column(students, name, 50) for name in feature_names})
+
+    if latest_sem not in marks_bundle:
+        return [{"error": f"No trained model or scaler found for Semester {latest_sem}."}] * count
+
+    results = [{"error": f"Missing marks or attendance data for Semester {latest_sem} prediction"}] * count
+    complete = input_features_df.notna().all(axis=1).to_numpy()
+    if not complete.any():
+        return results
+
+    # One matrix product for every student in this semester
+    input_features = input_features_df.loc[complete, marks_bundle.features(latest_sem)]
+    with metrics.stage("model"):
+        predicted_marks = marks_bundle.predict(latest_sem, input_features)
+
+    totals = total_obtainable_marks[latest_sem][complete].to_numpy(dtype=float)
+    final_predicted_marks = (predicted_marks / 100) * totals
+    final_predicted_marks = np.clip(np.rint(final_predicted_marks), 0, totals)
+    predicted_perc = (final_predicted_marks / totals) * 100
+
+    predicted_grade_range = _grade_ranges(predicted_perc)
+    complete_students = students[complete]
+    complete_totals = {sem: totals_col[complete] for sem, totals_col in total_obtainable_marks.items()}
+    prev_sem1 = _previous_sem_data(complete_students, latest_sem - 1, complete_totals)
+    prev_sem2 = _previous_sem_data(complete_students, latest_sem - 2, complete_totals)
+    attendance_perc = input_features_df[f"sem_{latest_sem}_attendance_perc"][complete].tolist()
+
+    positions = np.flatnonzero(complete)
+    for i, position in enumerate(positions):
+        results[position] = {
+            "latest_sem": latest_sem,
+            "current_attendance_perc": attendance_perc[i],
+            "predicted_perc": round(float(predicted_perc[i]), 2),
+            "predicted_grade_range": predicted_grade_range[i],
+            "prev_sem1_marks": prev_sem1["marks"][i],
+            "prev_sem1_total_obtainable": prev_sem1["total_obtainable"][i],
+            "prev_sem1_perc": prev_sem1["perc"][i],
+            "prev_sem1_grade": prev_sem1["grade"][i],
+            "prev_sem2_marks": prev_sem2["marks"][i],
+            "prev_sem2_total_obtainable": prev_sem2["total_obtainable"][i],
+            "prev_sem2_perc": prev_sem2["perc"][i],
+            "prev_sem2_grade": prev_sem2["grade"][i]
+        }
+    return results
+
+
+def predict_marks_batch(students):
+    # Returns one result per input row, in the same order
+    students = students.reset_index(drop=True)
+    results = [{"error": "Missing current_sem in input data"}] * len(students)
+    if students.empty or "current_sem" not in students.columns:
+        return results
+
+    total_obtainable_marks = {
+        sem: _column(students, f"sem_{sem}_obtainable_total", 1000).fillna(1000).replace(0, 1000)
+        for sem in range(1, 7)
+    }
+
+    # One bundle for the whole batch, even if a reload swaps it meanwhile
+    marks_bundle = get_marks_bundle()
+    for latest_sem, group in students.groupby("current_sem", sort=False):
+        latest_sem = int(latest_sem)
+        group_totals = {sem: totals[group.index] for sem, totals in total_obtainable_marks.items()}
+        try:
+            group_results = _predict_semester(group, latest_sem, group_totals, marks_bundle)
+        except Exception as e:
+            group_results = [{"error": str(e)}] * len(group)
+        for position, result in zip(group.index, group_results):
+            results[position] = result
+    return results
 
-with open(os.path.join(MODEL_FOLDER, 'scaler.pkl'), 'rb') as f:
-    scaler = pickle.load(f)
 
 def predict_marks(input_data):
     try:
-        latest_sem = input_data.get("current_sem")
-        if latest_sem is None:
-            return {"error": "Missing current_sem in input data"}
-
-        total_obtainable_marks = {
-            sem: input_data.get(f"sem_{sem}_obtainable_total", 1000) or 1000
-            for sem in range(1, 7)
-        }
-
-        if latest_sem not in total_obtainable_marks:
-            return {"error": f"Total obtainable marks for Semester {latest_sem} is missing"}
-
-        input_features = []
-        feature_names = []
-
-        for s in range(max(1, latest_sem - 2), latest_sem):
-            feature_marks = input_data.get(f"sem_{s}_marks_percentage", 50)
-            input_features.append(feature_marks)
-            feature_names.append(f"sem_{s}_marks_percentage")
-
-        attendance_perc = input_data.get(f"sem_{latest_sem}_attendance_perc", 50)
-        input_features.append(attendance_perc)
-        feature_names.append(f"sem_{latest_sem}_attendance_perc")
-
-        input_features = np.array([input_features])
-
-        if latest_sem in loaded_model and latest_sem in scaler:
-            model = loaded_model[latest_sem]
-            scale = scaler[latest_sem]
-
-            input_features_df = pd.DataFrame(input_features, columns=feature_names)
-            input_features_scaled = scale.transform(input_features_df)
-
-            predicted_marks = model.predict(input_features_scaled)[0]
-            
-            final_predicted_marks = (predicted_marks / 100) * total_obtainable_marks[latest_sem]
-            final_predicted_marks = max(0, min(int(round(final_predicted_marks)), total_obtainable_marks[latest_sem]))
-
-            predicted_perc = (final_predicted_marks / total_obtainable_marks[latest_sem]) * 100
-
-            grade_thresholds = {
-                "O": 80, "A+": 70, "A": 60, "B+": 55, "B": 50, "C": 45, "D": 40, "F": 0
-            }
-
-            def get_grade_range(percentage):
-                for grade, threshold in grade_thresholds.items():
-                    if percentage >= threshold:
-                        return grade
-                return "F"
-
-            predicted_grade_range = get_grade_range(predicted_perc)
-
-            def get_previous_sem_data(semester):
-                if semester < 1:
-                    return {"perc": "N/A", "marks": "N/A", "total_obtainable": "N/A", "grade": "N/A"}
-                marks = input_data.get(f"sem_{semester}_marks_total", 0)
-                total_marks = total_obtainable_marks.get(semester, 1000)
-                perc = (marks / total_marks) * 100 if total_marks else 0
-                grade = get_grade_range(perc)
-                return {"perc": round(perc, 2), "marks": marks, "total_obtainable": total_marks, "grade": grade}
-
-            prev_sem1 = get_previous_sem_data(latest_sem - 1)
-            prev_sem2 = get_previous_sem_data(latest_sem - 2)
-
-            return {
-                "latest_sem": latest_sem,
-                "current_attendance_perc": attendance_perc,
-                "predicted_perc": round(predicted_perc, 2),
-                "predicted_grade_range": predicted_grade_range,
-                "prev_sem1_marks": prev_sem1["marks"],
-                "prev_sem1_total_obtainable": prev_sem1["total_obtainable"],
-                "prev_sem1_perc": round((prev_sem1["marks"] / prev_sem1["total_obtainable"]) * 100, 2) if prev_sem1["total_obtainable"] > 0 else None,
-                "prev_sem1_grade": prev_sem1["grade"],
-                "prev_sem2_marks": prev_sem2["marks"],
-                "prev_sem2_total_obtainable": prev_sem2["total_obtainable"],
-                "prev_sem2_perc": round((prev_sem2["marks"] / prev_sem2["total_obtainable"]) * 100, 2) if prev_sem2["total_obtainable"] > 0 else None,
-                "prev_sem2_grade": prev_sem2["grade"]
-            }
-
-        else:
-            return {"error": f"No trained model or scaler found for Semester {latest_sem}."}
+        return predict_marks_batch(pd.DataFrame([input_data]))[0]
     except Exception as e:
         return {"error": str(e)}
@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+# Stage timers and counters for the prediction endpoints and the background
+# jobs, exported in the Prometheus text format by /metrics. Every stage
+# (db, decrypt, features, model, ...) goes into a latency histogram labelled
+# with the request endpoint or job it ran in, and into that request's own
+# breakdown, which the server can send back as a Server-Timing header.
+# With METRICS_ENABLED=0 the helpers return straight away.
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "0") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+
+HELP = {
+    "http_request_duration_seconds": "Request latency by endpoint and status",
+    "request_errors_total": "Requests answered with a 500, by exception type",
+    "stage_duration_seconds": "Time spent in each stage of a request or job",
+    "job_duration_seconds": "Background job run time",
+    "job_runs_total": "Background job runs by outcome",
+    "db_queries_total": "SQL queries by outcome",
+    "decrypt_requests_total": "Calls to the Flask decrypt service",
+}
+
+_NOOP = nullcontext()
+_scope = ContextVar("metrics_scope", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # Buckets are upper bounds (le), the last slot is +Inf
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Scope:
+    # Stage times of one request or job run. Stages that run concurrently
+    # (e.g. gathered queries) add up, so the total can exceed the wall time.
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def add_collector(self, collect):
+        # collect() -> [(name, type, help, [(labels dict, value), ...]), ...],
+        # read at scrape time (for stats the other modules already keep)
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+
+        declared = set()
+        def declare(name, kind, help_text=None):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {name} {help_text or HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            declare(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {_value(value)}")
+
+        for (name, labels), histogram in histograms:
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), histogram.counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _value(bound)
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_value(histogram.sum)}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+        for collect in self._collectors:
+            for name, kind, help_text, samples in collect():
+                declare(name, kind, help_text)
+                for labels, value in samples:
+                    if value is not None:
+                        lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def _value(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+registry = MetricsRegistry()
+
+
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.started
+        scope = _scope.get()
+        if scope is not None:
+            scope.add(self.name, seconds)
+        registry.observe("stage_duration_seconds", seconds,
+                         scope=scope.name if scope is not None else "other", stage=self.name)
+        return False
+
+
+def stage(name):
+    # with stage("db"): ... -- works in sync and async code alike
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _Stage(name)
+
+
+def count(name, value=1, **labels):
+    if METRICS_ENABLED:
+        registry.inc(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    if METRICS_ENABLED:
+        registry.observe(name, seconds, **labels)
+
+
+def begin_scope(name):
+    # Stages timed from here on (including tasks started from this context)
+    # are attributed to `name`; returns a token for end_scope
+    if not METRICS_ENABLED:
+        return None
+    return _scope.set(Scope(name))
+
+
+def end_scope(token):
+    if token is None:
+        return None
+    scope = _scope.get()
+    _scope.reset(token)
+    return scope
+
+
+def current_scope():
+    return _scope.get()
+
+
+@contextmanager
+def job(name):
+    # with job("incremental_ingestion") as scope: ... -- run time, outcome
+    # and stage breakdown (scope.stages) of a background job
+    token = begin_scope(name)
+    status = "failed"
+    try:
+        yield _scope.get() if token is not None else None
+        status = "succeeded"
+    finally:
+        scope = end_scope(token)
+        if scope is not None:
+            observe("job_duration_seconds", scope.elapsed(), job=name)
+            count("job_runs_total", job=name, status=status)
@@ -0,0 +1,313 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from services.attendance_predictions import DATASET_COLUMNS, FEATURES
+from services.attendance_summary import SUMMARY_COLUMNS, AttendanceSummary
+from services.attendance_trends import build_trend_index
+from services.encoder_registry import EncoderRegistry, load_encoder_tables, tables_from_label_encoders
+from services.native_scorer import check_parity, compile_native_scorer, load_native_scorer
+
+# Versioned attendance artifacts (encoders, scaler, model, processed dataset,
+# its trend index and the per-subject attendance summary). A new set is
+# loaded and validated in the background and then swapped in as a single
+# reference, so requests that already took the old set finish on it.
+
+logger = logging.getLogger(__name__)
+
+MODEL_FOLDER = os.path.join("models", "attendance")
+MANIFEST_FILE = os.path.join(MODEL_FOLDER, "manifest.json")
+ARTIFACT_FILES = {
+    'le_day': 'le_day.pkl',
+    'le_subject': 'le_subject.pkl',
+    'le_teacher': 'le_teacher.pkl',
+    'le_lecture_type': 'le_lecture_type.pkl',
+    'scaler': 'scaler.pkl',
+    'voting_model': 'voting_model.pkl',
+}
+# Exported by training; built from the pickles when they are missing
+OPTIONAL_ARTIFACT_FILES = {
+    'native_scorer': 'native_scorer.npz',
+    'encoder_tables': 'encoders.json',
+}
+# Set to 0 to score with sklearn's predict_proba instead
+USE_NATIVE_SCORER = os.getenv("USE_NATIVE_SCORER", "1") == "1"
+VALIDATION_ROWS = 50
+
+
+class AttendanceArtifacts:
+    def __init__(self, version, models, data, manifest=None, scorer=None, encoder_tables=None, summary=None):
+        self.version = version
+        self.manifest = manifest or {}
+        self.le_day = models['le_day']
+        self.le_subject = models['le_subject']
+        self.le_teacher = models['le_teacher']
+        self.le_lecture_type = models['le_lecture_type']
+        self.scaler = models['scaler']
+        self.voting_model = models['voting_model']
+        self.scorer = scorer
+        self.encoders = EncoderRegistry(encoder_tables or tables_from_label_encoders(models))
+        self.data = data
+        self.trend_index = build_trend_index(data)
+        if summary is None:
+            # No raw store: count the processed rows instead
+            rows = data[SUMMARY_COLUMNS].dropna(subset=['subject']).astype({'subject': np.int64})
+            rows['subject'] = self.encoders.decode('subject', rows['subject'])
+            summary = AttendanceSummary(rows, summary_version(None))
+        self.summary = summary
+        self.loaded_at = datetime.now().isoformat(timespec='seconds')
+
+    def predict_proba(self, features):
+        # Probability of attending for each row of the FEATURES frame
+        if self.scorer is not None:
+            return self.scorer.predict_proba(features)[:, 1]
+        return self.voting_model.predict_proba(self.scaler.transform(features))[:, 1]
+
+
+def _sha256(payload):
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _read_artifact_bytes(folder):
+    payloads = {}
+    for name, file_name in ARTIFACT_FILES.items():
+        with open(os.path.join(folder, file_name), 'rb') as f:
+            payloads[name] = f.read()
+    for name, file_name in OPTIONAL_ARTIFACT_FILES.items():
+        path = os.path.join(folder, file_name)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                payloads[name] = f.read()
+    return payloads
+
+
+def _content_version(payloads):
+    digest = hashlib.sha256()
+    for payload in payloads.values():
+        digest.update(payload)
+    return "local-" + digest.hexdigest()[:12]
+
+
+def read_manifest(folder=None):
+    manifest_file = os.path.join(folder, "manifest.json") if folder else MANIFEST_FILE
+    if not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file) as f:
+        return json.load(f)
+
+
+def write_manifest(rows=None, folder=None):
+    # Called by training once every artifact has been written; the manifest
+    # is what makes a new version visible to the registry.
+    folder = folder or MODEL_FOLDER
+    files = {name: _sha256(payload) for name, payload in _read_artifact_bytes(folder).items()}
+    now = datetime.now()
+    fingerprint = _sha256(json.dumps([files, rows, now.isoformat()]).encode())[:8]
+    manifest = {
+        "version": f"{now.strftime('%Y%m%dT%H%M%S')}-{fingerprint}",
+        "created_at": now.isoformat(timespec='seconds'),
+        "rows": rows,
+        "files": files,
+    }
+    manifest_file = os.path.join(folder, "manifest.json")
+    tmp_path = manifest_file + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_file)
+    return manifest
+
+
+def current_version(folder=None):
+    # Artifacts committed without a manifest are versioned by their content
+    manifest = read_manifest(folder)
+    if manifest is not None:
+        return manifest["version"]
+    return _content_version(_read_artifact_bytes(folder or MODEL_FOLDER))
+
+
+def summary_version(watermark):
+    # Changes with every ingestion run that writes rows
+    if watermark is None:
+        return "initial"
+    return f"{watermark['rows']}@{watermark['updated_at']}"
+
+
+def load_attendance_summary():
+    # Counted from the raw store, which ingestion keeps current between retrains
+    from db.attendance_data_fetch import load_attendance_dataset, load_watermark
+    rows = load_attendance_dataset(columns=SUMMARY_COLUMNS)
+    if rows is None:
+        return None
+    return AttendanceSummary(rows, summary_version(load_watermark()))
+
+
+def load_artifacts(folder=None):
+    folder = folder or MODEL_FOLDER
+    manifest = read_manifest(folder)
+    payloads = _read_artifact_bytes(folder)
+
+    if manifest is not None:
+        # A hash mismatch means training is still writing this version
+        for name, payload in payloads.items():
+            if manifest["files"].get(name) != _sha256(payload):
+                raise ValueError(f"{name} does not match manifest version {manifest['version']}")
+        version = manifest["version"]
+    else:
+        version = _content_version(payloads)
+
+    scorer_payload = payloads.pop('native_scorer', None)
+    tables_payload = payloads.pop('encoder_tables', None)
+    models = {name: pickle.load(io.BytesIO(payload)) for name, payload in payloads.items()}
+
+    scorer = None
+    if USE_NATIVE_SCORER:
+        try:
+            if scorer_payload is not None:
+                scorer = load_native_scorer(io.BytesIO(scorer_payload))
+            else:
+                scorer = compile_native_scorer(models['scaler'], models['voting_model'])
+        except ValueError as e:
+            logger.warning(f"Scoring with sklearn, native scorer unavailable: {e}")
+
+    # Only the columns the predictor needs are read from the columnar store
+    # (pyarrow is imported here, when the first version is loaded)
+    from db.attendance_store import read_processed_attendance
+    data = read_processed_attendance(columns=DATASET_COLUMNS)
+    if data is None:
+        data = pd.DataFrame(columns=DATASET_COLUMNS)
+
+    encoder_tables = load_encoder_tables(tables_payload) if tables_payload is not None else None
+    summary = load_attendance_summary()
+    return AttendanceArtifacts(version, models, data, manifest, scorer, encoder_tables, summary)
+
+
+def validate_artifacts(artifacts):
+    for name in ['le_day', 'le_subject', 'le_teacher', 'le_lecture_type']:
+        if len(getattr(artifacts, name).classes_) == 0:
+            raise ValueError(f"{name} has no classes")
+
+    # The persisted tables must agree with the pickled encoders
+    for col, classes in tables_from_label_encoders(vars(artifacts)).items():
+        if col in artifacts.encoders.encoders and artifacts.encoders.classes(col) != classes:
+            raise ValueError(f"Encoder table for {col} does not match its LabelEncoder")
+
+    if artifacts.scaler.n_features_in_ != len(FEATURES):
+        raise ValueError(f"Scaler expects {artifacts.scaler.n_features_in_} features, predictor sends {len(FEATURES)}")
+
+    rows = artifacts.manifest.get("rows")
+    if rows is not None and rows != len(artifacts.data):
+        raise ValueError(f"Processed dataset has {len(artifacts.data)} rows, manifest expects {rows}")
+
+    data = artifacts.data
+    for col in ['subject', 'teacher', 'day_name', 'lecture_type']:
+        if not data.empty and data[col].max() >= len(artifacts.encoders.classes(col)):
+            raise ValueError(f"Processed dataset has {col} codes unknown to the encoder")
+
+    # Smoke prediction on real rows (or a zero row when there is no data yet)
+    sample = data[FEATURES].dropna().head(VALIDATION_ROWS)
+    if sample.empty:
+        sample = pd.DataFrame([[0] * len(FEATURES)], columns=FEATURES)
+    probabilities = artifacts.voting_model.predict_proba(artifacts.scaler.transform(sample))
+    if probabilities.shape != (len(sample), 2) or not np.isfinite(probabilities).all():
+        raise ValueError("Model returned invalid probabilities")
+
+    # The native scorer is only a speed-up: on a mismatch this version is
+    # still served, through sklearn
+    if artifacts.scorer is not None:
+        try:
+            check_parity(artifacts.scorer, artifacts.scaler, artifacts.voting_model, sample)
+        except Exception as e:
+            logger.warning(f"Scoring with sklearn, native scorer failed its parity check: {e}")
+            artifacts.scorer = None
+
+
+class ModelRegistry:
+    def __init__(self, folder=None):
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._current = None
+        self._stats = {"reloads": 0, "failed_reloads": 0, "last_error": None, "last_reload_seconds": None}
+
+    def current(self):
+        # The returned set stays valid for the caller even if a reload swaps
+        # in a newer one meanwhile
+        with self._lock:
+            artifacts = self._current
+        if artifacts is None:
+            self.reload()
+            with self._lock:
+                artifacts = self._current
+        if artifacts is None:
+            raise RuntimeError("No attendance model is loaded")
+        return artifacts
+
+    def reload(self, force=False):
+        # Returns True when a new version was swapped in. Concurrent callers
+        # wait for the running reload instead of loading twice.
+        with self._reload_lock:
+            with self._lock:
+                active = self._current
+            try:
+                if active is not None and not force and current_version(self.folder) == active.version:
+                    return False
+                start = time.perf_counter()
+                candidate = load_artifacts(self.folder)
+                validate_artifacts(candidate)
+            except Exception as e:
+                logger.error(f"Keeping model version {active.version if active else None}: {e}")
+                with self._lock:
+                    self._stats["failed_reloads"] += 1
+                    self._stats["last_error"] = str(e)
+                return False
+
+            with self._lock:
+                self._current = candidate
+                self._stats["reloads"] += 1
+                self._stats["last_error"] = None
+                self._stats["last_reload_seconds"] = round(time.perf_counter() - start, 3)
+            logger.info(f"Attendance model version {candidate.version} is now active")
+            return True
+
+    def apply_ingestion(self, result):
+        # Brings the active set's summary up to date with an ingestion run
+        # (process_new_attendance's result); a full run recounts the store
+        with self._reload_lock:
+            with self._lock:
+                active = self._current
+            if active is None or result is None:
+                return
+            if result.get("new_rows") is None:
+                summary = load_attendance_summary()
+                if summary is not None:
+                    active.summary = summary
+                return
+            active.summary.apply(result["new_rows"], result["replaced_rows"], summary_version(result["watermark"]))
+
+    def loaded(self):
+        with self._lock:
+            return self._current is not None
+
+    def stats(self):
+        with self._lock:
+            active = self._current
+            stats = dict(self._stats)
+        stats.update(
+            version=active.version if active else None,
+            native_scorer=active.scorer is not None if active else False,
+            encoders=active.encoders.stats() if active else {},
+            loaded_at=active.loaded_at if active else None,
+            rows=len(active.data) if active else 0,
+            summary=active.summary.stats() if active else {},
+        )
+        return stats
+
+
+model_registry = ModelRegistry()
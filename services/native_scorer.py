@@ -0,0 +1,128 @@
+import numpy as np
+
+# NumPy-only scorer for the attendance ensemble (StandardScaler followed by a
+# soft VotingClassifier of one DecisionTree and one binary LogisticRegression).
+# The fitted arrays are copied out once; scoring is a fused
+# scale -> tree walk -> sigmoid -> average with no sklearn dispatch/validation.
+# Each step repeats sklearn's arithmetic, so results match predict_proba.
+# sklearn is imported on first use, which keeps it out of the server's
+# import time.
+
+PARITY_TOLERANCE = 1e-9
+
+
+def _sigmoid(x):
+    # Clipped so exp() can't overflow; past +-700 the result is 0 or 1 anyway
+    return 1.0 / (1.0 + np.exp(-np.clip(x, -700.0, 700.0)))
+
+
+class NativeScorer:
+    def __init__(self, arrays):
+        self.mean = arrays["mean"]
+        self.scale = arrays["scale"]
+        self.children_left = arrays["children_left"]
+        self.children_right = arrays["children_right"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.leaf_proba = arrays["leaf_proba"]
+        self.coef = arrays["coef"]
+        self.intercept = arrays["intercept"]
+        self.max_depth = int(arrays["max_depth"])
+        self.n_features = self.mean.shape[0]
+
+    def arrays(self):
+        return {
+            "mean": self.mean, "scale": self.scale,
+            "children_left": self.children_left, "children_right": self.children_right,
+            "feature": self.feature, "threshold": self.threshold, "leaf_proba": self.leaf_proba,
+            "coef": self.coef, "intercept": self.intercept, "max_depth": np.array(self.max_depth),
+        }
+
+    def _tree_proba(self, X_scaled):
+        # sklearn trees compare float32 features against float64 thresholds
+        X32 = X_scaled.astype(np.float32)
+        rows = np.arange(X32.shape[0])
+        node = np.zeros(X32.shape[0], dtype=np.intp)
+        for _ in range(self.max_depth):
+            left = self.children_left[node]
+            inner = left != -1
+            if not inner.any():
+                break
+            go_left = X32[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(inner, np.where(go_left, left, self.children_right[node]), node)
+        return self.leaf_proba[node]
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got {X.shape}")
+        if np.isnan(X).any():
+            raise ValueError("Input X contains NaN.")
+
+        X_scaled = (X - self.mean) / self.scale
+
+        tree = self._tree_proba(X_scaled)
+
+        decision = (X_scaled @ self.coef.T + self.intercept).reshape(-1)
+        positive = _sigmoid(decision)
+        linear = np.vstack([1 - positive, positive]).T
+
+        # Soft voting with equal weights
+        return np.mean([tree, linear], axis=0)
+
+
+def compile_native_scorer(scaler, voting_model):
+    # Raises ValueError when the fitted objects aren't the supported shape
+    from sklearn.ensemble import VotingClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.tree import DecisionTreeClassifier
+
+    if not isinstance(voting_model, VotingClassifier) or voting_model.voting != 'soft':
+        raise ValueError("Only soft VotingClassifier ensembles can be compiled")
+    if voting_model.weights is not None or len(voting_model.classes_) != 2:
+        raise ValueError("Only unweighted binary ensembles can be compiled")
+
+    estimators = dict(zip([name for name, _ in voting_model.estimators], voting_model.estimators_))
+    trees = [est for est in estimators.values() if isinstance(est, DecisionTreeClassifier)]
+    linear = [est for est in estimators.values() if isinstance(est, LogisticRegression)]
+    if len(trees) != 1 or len(linear) != 1 or len(estimators) != 2:
+        raise ValueError("Expected exactly one DecisionTreeClassifier and one LogisticRegression")
+    # The vote averages in estimator order; keep the tree first like training does
+    if not isinstance(voting_model.estimators_[0], DecisionTreeClassifier):
+        raise ValueError("Expected the decision tree to be the first estimator")
+    tree, logistic = trees[0].tree_, linear[0]
+    if logistic.coef_.shape[0] != 1:
+        raise ValueError("Expected a binary LogisticRegression")
+
+    return NativeScorer({
+        "mean": np.asarray(scaler.mean_, dtype=np.float64),
+        "scale": np.asarray(scaler.scale_, dtype=np.float64),
+        "children_left": tree.children_left.astype(np.intp),
+        "children_right": tree.children_right.astype(np.intp),
+        "feature": np.maximum(tree.feature, 0).astype(np.intp),
+        "threshold": tree.threshold.astype(np.float64),
+        "leaf_proba": tree.value[:, 0, :2].astype(np.float64),
+        "coef": logistic.coef_.astype(np.float64),
+        "intercept": logistic.intercept_.astype(np.float64),
+        "max_depth": np.array(tree.max_depth),
+    })
+
+
+def check_parity(scorer, scaler, voting_model, X):
+    # Largest absolute difference to the sklearn pipeline on X
+    expected = voting_model.predict_proba(scaler.transform(X))
+    actual = scorer.predict_proba(X)
+    difference = float(np.max(np.abs(expected - actual))) if len(expected) else 0.0
+    if difference > PARITY_TOLERANCE:
+        raise ValueError(f"Native scorer differs from predict_proba by {difference}")
+    return difference
+
+
+def save_native_scorer(scorer, path):
+    with open(path, 'wb') as f:
+        np.savez(f, **scorer.arrays())
+
+
+def load_native_scorer(path):
+    with np.load(path) as arrays:
+        return NativeScorer({name: arrays[name] for name in arrays.files})
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Response cache for the single-student prediction endpoints. Keys carry the
+# model version and a per-family data version, so a retrain or an ingestion
+# run makes older entries unreachable; invalidate() also frees them at once.
+# Entries are evicted least-recently-used once their total JSON size passes
+# the memory budget. Concurrent misses for the same key share one computation.
+
+PREDICTION_CACHE_MB = float(os.getenv("PREDICTION_CACHE_MB", "64"))
+# Upper bound on an entry's age, for inputs the server isn't told about
+# (e.g. marks changing in the student summary table)
+PREDICTION_CACHE_TTL = int(os.getenv("PREDICTION_CACHE_TTL", "3600"))
+
+_MISSING = object()
+
+
+def _entry_size(key, value):
+    return len(json.dumps(value, default=str)) + len(repr(key))
+
+
+class PredictionCache:
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._versions = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def data_version(self, family):
+        with self._lock:
+            return self._versions.setdefault(family, 0)
+
+    def invalidate(self, family=None):
+        # Bumps the data version and drops the family's entries (all when None)
+        with self._lock:
+            families = [family] if family is not None else list(self._versions)
+            for name in families:
+                self._versions[name] = self._versions.get(name, 0) + 1
+            for key in [key for key in self._data if family is None or key[0] == family]:
+                self._drop(key)
+            self.invalidations += 1
+
+    def _drop(self, key):
+        _, size, _ = self._data.pop(key)
+        self.bytes -= size
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[2] > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._drop(key)
+            self.misses += 1
+            return _MISSING
+
+    def set(self, key, value):
+        size = _entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, size, time.monotonic() + self.ttl)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    async def get_or_compute(self, key, compute):
+        # compute() returns (body, status); only successful answers (status
+        # 200 without an "error" field) are stored
+        cached = self.get(key)
+        if cached is not _MISSING:
+            return cached, 200
+
+        loop = asyncio.get_running_loop()
+        inflight_key = (loop, key)
+        task = self._inflight.get(inflight_key)
+        if task is None:
+            task = loop.create_task(self._compute(key, compute))
+            self._inflight[inflight_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(inflight_key, None))
+        else:
+            with self._lock:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _compute(self, key, compute):
+        body, status = await compute()
+        failed = isinstance(body, dict) and "error" in body
+        if status == 200 and not failed and self.max_bytes > 0:
+            self.set(key, body)
+        return body, status
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "data_versions": dict(self._versions),
+            }
+
+
+prediction_cache = PredictionCache(int(PREDICTION_CACHE_MB * 1024 * 1024), PREDICTION_CACHE_TTL)